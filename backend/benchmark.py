@@ -0,0 +1,232 @@
+"""
+Benchmarks for the backend preprocessing path.
+
+Usage:
+    python benchmark.py startup --model-type DPT_Hybrid
+    python benchmark.py rembg --images photo1.jpg photo2.jpg --max-side 512 1024
+    python benchmark.py decode --images photo1.jpg --working-side 1024
+    python benchmark.py loadtest --url http://localhost:8000 --image photo.jpg --concurrency 16
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+def bench_startup(args):
+    from utils.depth_models import time_to_ready
+    from utils.preprocessing import Preprocessor
+
+    device = torch.device(args.device) if args.device else None
+    results = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        preprocessor = Preprocessor(device=device, model_type=args.model_type)
+        preprocessor.warmup()
+        results.append({
+            **preprocessor.status(),
+            "time_to_ready_s": time.perf_counter() - start,
+        })
+        del preprocessor
+    results.append(time_to_ready(args.model_type, device or ("cuda" if torch.cuda.is_available() else "cpu")))
+    return results
+
+def _timed(fn, *args, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return result, float(np.median(timings))
+
+def _mask_iou(a, b):
+    a = np.asarray(a) > 127
+    b = np.asarray(b) > 127
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+def _load_images(paths, synthetic_size):
+    if paths:
+        return [(path, Image.open(path).convert("RGB")) for path in paths]
+    # A 12MP-class frame with a bright ellipse as the subject
+    w, h = synthetic_size
+    yy, xx = np.mgrid[:h, :w]
+    subject = ((xx - w / 2) / (w / 4)) ** 2 + ((yy - h / 2) / (h / 3)) ** 2 < 1
+    pixels = np.where(subject[..., None], [220, 90, 40], [30, 30, 30]).astype(np.uint8)
+    return [(f"synthetic_{w}x{h}", Image.fromarray(pixels))]
+
+def bench_rembg(args):
+    from rembg import new_session
+    from utils.preprocessing import remove_background, segmentation_mask
+
+    session = new_session(args.rembg_model)
+    results = []
+    for name, image in _load_images(args.images, args.synthetic_size):
+        reference_mask = segmentation_mask(image, session)
+        _, full_time = _timed(remove_background, image, session, 0, repeat=args.repeat)
+        results.append({"image": name, "size": image.size, "max_side": 0, "latency_s": full_time, "mask_iou": 1.0})
+        for max_side in args.max_side:
+            _, capped_time = _timed(remove_background, image, session, max_side, repeat=args.repeat)
+            results.append({
+                "image": name,
+                "size": image.size,
+                "max_side": max_side,
+                "latency_s": capped_time,
+                "speedup": full_time / capped_time,
+                "mask_iou": _mask_iou(reference_mask, segmentation_mask(image, session, max_side)),
+            })
+    return results
+
+def _decode_in_child(image_bytes, working_side):
+    from utils.preprocessing import decode_image
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    image = decode_image(image_bytes, working_side).convert("RGB")
+    latency = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "decoded_size": image.size,
+        "decoded_bytes": image.size[0] * image.size[1] * 3,
+        "latency_s": latency,
+        "peak_rss_growth_kb": rss_after - rss_before,
+    }
+
+def bench_decode(args):
+    # Each decode runs in a fresh process so ru_maxrss reflects only that decode
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name, image in _load_images(args.images, args.synthetic_size):
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=92)
+        image_bytes = buffer.getvalue()
+        for working_side in [None, *args.working_side]:
+            runs = []
+            for _ in range(args.repeat):
+                with ctx.Pool(1) as pool:
+                    runs.append(pool.apply(_decode_in_child, (image_bytes, working_side)))
+            results.append({
+                "image": name,
+                "size": image.size,
+                "working_side": working_side,
+                "decoded_size": runs[0]["decoded_size"],
+                "decoded_bytes": runs[0]["decoded_bytes"],
+                "latency_s": float(np.median([r["latency_s"] for r in runs])),
+                "peak_rss_growth_kb": int(np.median([r["peak_rss_growth_kb"] for r in runs])),
+            })
+    return results
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"count": len(samples), "p50_s": float(p50), "p95_s": float(p95), "p99_s": float(p99), "max_s": float(max(samples))}
+
+async def _loadtest(args):
+    import httpx
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    content_type = "image/png" if args.image.lower().endswith(".png") else "image/jpeg"
+    upload_latencies, probe_latencies, errors = [], [], 0
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        async def upload():
+            nonlocal errors
+            start = time.perf_counter()
+            response = await client.post(
+                args.endpoint,
+                files={"file": ("upload", image_bytes, content_type)},
+                params={"file_format": "ply"},
+            )
+            if response.status_code != 200:
+                errors += 1
+            upload_latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            # A trivial endpoint: its latency under load measures event loop stalls
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(args.probe_interval)
+
+        async def worker(n):
+            for _ in range(n):
+                await upload()
+
+        probe_task = asyncio.create_task(probe())
+        per_worker = max(1, args.requests // args.concurrency)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(per_worker) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return [{
+        "concurrency": args.concurrency,
+        "requests": len(upload_latencies),
+        "errors": errors,
+        "throughput_rps": len(upload_latencies) / elapsed,
+        "upload": _percentiles(upload_latencies),
+        "event_loop_probe": _percentiles(probe_latencies),
+    }]
+
+def bench_loadtest(args):
+    return asyncio.run(_loadtest(args))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=None, help="Append results as JSON lines to this file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    startup = sub.add_parser("startup", help="Time-to-ready of the Preprocessor and its MiDaS model")
+    startup.add_argument("--model-type", default="DPT_Hybrid")
+    startup.add_argument("--device", default=None)
+    startup.add_argument("--repeat", type=int, default=1)
+    startup.set_defaults(func=bench_startup)
+
+    rembg = sub.add_parser("rembg", help="Full-resolution vs capped background removal: latency and mask IoU")
+    rembg.add_argument("--images", nargs="*", default=None)
+    rembg.add_argument("--synthetic-size", type=int, nargs=2, default=(4032, 3024), metavar=("W", "H"))
+    rembg.add_argument("--max-side", type=int, nargs="+", default=[512, 1024, 2048])
+    rembg.add_argument("--rembg-model", default="u2net")
+    rembg.add_argument("--repeat", type=int, default=3)
+    rembg.set_defaults(func=bench_rembg)
+
+    decode = sub.add_parser("decode", help="Full vs reduced-size JPEG decode: latency and memory")
+    decode.add_argument("--images", nargs="*", default=None, help="Images to re-encode as JPEG (default: synthetic)")
+    decode.add_argument("--synthetic-size", type=int, nargs=2, default=(4032, 3024), metavar=("W", "H"))
+    decode.add_argument("--working-side", type=int, nargs="+", default=[512, 1024])
+    decode.add_argument("--repeat", type=int, default=3)
+    decode.set_defaults(func=bench_decode)
+
+    loadtest = sub.add_parser("loadtest", help="Concurrent uploads against a running backend: p50/p95/p99 latency")
+    loadtest.add_argument("--url", default="http://localhost:8000")
+    loadtest.add_argument("--endpoint", default="/inference/pointcloud")
+    loadtest.add_argument("--image", required=True)
+    loadtest.add_argument("--concurrency", type=int, default=8)
+    loadtest.add_argument("--requests", type=int, default=64)
+    loadtest.add_argument("--probe-interval", type=float, default=0.05)
+    loadtest.add_argument("--timeout", type=float, default=300)
+    loadtest.set_defaults(func=bench_loadtest)
+
+    args = parser.parse_args()
+
+    results = args.func(args)
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({"benchmark": args.command, **result}) + "\n")
+
+if __name__ == "__main__":
+    main()
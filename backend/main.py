@@ -1,7 +1,29 @@
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from routers import inference, process
+from utils.preprocessing import init_preprocessor, preprocessor_status
+from utils.executors import init_executors, shutdown_executors, executor_stats
+from utils.service_client import SERVICES, init_service_clients, close_service_clients, service_client_stats
+from utils.auth import init_token_cache, close_token_cache, token_cache_stats
+from utils.wire import PREPROCESS_REMOTE
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load MiDaS and the rembg session once per worker instead of once per request,
+    # unless the model service preprocesses uploads itself
+    if not PREPROCESS_REMOTE:
+        init_preprocessor()
+    init_executors()
+    init_service_clients()
+    await init_token_cache([url for url, _ in SERVICES.values()])
+    yield
+    await close_token_cache()
+    await close_service_clients()
+    shutdown_executors()
 
 app = FastAPI(
     title="3D Reconstruction API",
@@ -9,7 +31,8 @@ app = FastAPI(
     docs_url="/docs",
     openapi_url="/openapi.json",
     redoc_url="/redoc",
-    root_path="/api"
+    root_path="/api",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -25,4 +48,17 @@ app.include_router(process.router)
 
 @app.get("/")
 async def root(): 
-    return {"message": "Hello World"}
\ No newline at end of file
+    return {"message": "Hello World"}
+
+@app.get("/health")
+async def health():
+    status = {"ready": True, "remote": True} if PREPROCESS_REMOTE else preprocessor_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "loading", "preprocessor": status})
+    return {
+        "status": "healthy",
+        "preprocessor": status,
+        "executors": executor_stats(),
+        "upstreams": service_client_stats(),
+        "id_tokens": token_cache_stats(),
+    }
@@ -1,29 +1,28 @@
 from fastapi import APIRouter, HTTPException, File, UploadFile
 
-from google.oauth2 import service_account
 from google.cloud import aiplatform
 from google.protobuf import json_format
 from google.protobuf.struct_pb2 import Value
-import google.auth.transport.requests
 
-from utils.preprocessing import Preprocessor
+from utils.preprocessing import get_preprocessor
 from utils.gcs import GCSHandler
-from utils.postprocessing import save_xyz_file, save_ply_file
+from utils.postprocessing import save_xyz_file, save_ply_file, read_ply_points
+from utils.executors import run_in_stage
+from utils.service_client import get_service_client
+from utils.auth import get_id_token
+from utils.wire import PREPROCESS_REMOTE, tensor_request, image_request, preprocessing_info, decode_pointcloud_response
 from schemas.request import RequestUpsampling
 
-import json
 import os
-import requests
+from typing import Optional
 from dotenv import load_dotenv
 from tempfile import NamedTemporaryFile
 import numpy as np
-from plyfile import PlyData
 
 load_dotenv()
 UPSAMPLING_URL = os.getenv("UPSAMPLING_ENDPOINT", "")
 MAIN_URL = os.getenv("MAIN_MODEL_ENDPOINT", "")
 
-auth_req = google.auth.transport.requests.Request()
 
 router = APIRouter(
     prefix="/inference",
@@ -39,49 +38,63 @@ async def inference_root():
     return {"message": "Inference endpoint"}
 
 @router.post("/pointcloud")
-async def run_inference_pointcloud(file: UploadFile = File(...), file_format: str = "ply"):
+async def run_inference_pointcloud(
+    file: UploadFile = File(...),
+    file_format: str = "ply",
+    depth_backend: Optional[str] = None,
+    latency_budget_ms: Optional[float] = None,
+):
     """
     Run inference on the uploaded image.
+
+    depth_backend selects a loaded depth estimator (e.g. DPT_Hybrid, MiDaS_small, silhouette);
+    latency_budget_ms picks the most accurate one that fits the budget. Both are ignored with
+    PREPROCESS_REMOTE, where the model service uses its own configured depth estimator.
     """
     if file.content_type not in ["image/png", "image/jpeg"]:
         raise HTTPException(status_code=400, detail="Invalid file type")
+    if not PREPROCESS_REMOTE:
+        preprocessor = get_preprocessor()
+        try:
+            backend = preprocessor.select_depth_backend(depth_backend, latency_budget_ms)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        creds_token_id = service_account.IDTokenCredentials.from_service_account_file(
-            "./secrets/key.json",
-            target_audience=MAIN_URL
-        )
-        creds_token_id.refresh(auth_req)
-        TOKEN_ID = creds_token_id.token
+        TOKEN_ID = await get_id_token(MAIN_URL)
         
         image_bytes = await file.read()
-        input_np = Preprocessor().process(image_bytes)
-        payload = {
-            "body": json.dumps(input_np.tolist())
-        }
-              
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {TOKEN_ID}"
-        }
-        print("-----Inferencing...-----")
-        response = requests.post(f"{MAIN_URL}/predict", headers=headers, json=payload)
-        data = response.json()
+        if PREPROCESS_REMOTE:
+            # The model service segments, estimates depth and predicts in one batched pipeline
+            request_kwargs = image_request(image_bytes, file.content_type)
+            request_kwargs["headers"]["Authorization"] = f"Bearer {TOKEN_ID}"
+            print("-----Inferencing from image...-----")
+            response = await get_service_client("main").post("/predict_image", **request_kwargs)
+            preprocessing = preprocessing_info(response)
+        else:
+            input_np, preprocessing = await run_in_stage(
+                "preprocess", preprocessor.process, image_bytes, depth_backend=backend.name, return_info=True
+            )
+            request_kwargs = tensor_request(input_np, lambda body: {"body": body})
+            request_kwargs["headers"]["Authorization"] = f"Bearer {TOKEN_ID}"
+            print("-----Inferencing...-----")
+            response = await get_service_client("main").post("/predict", **request_kwargs)
         
-        pointcloud = data.get("point_cloud", [])   
-        if not pointcloud:
+        points = decode_pointcloud_response(response, lambda data: data.get("point_cloud", []))
+        if points.size == 0:
             raise HTTPException(status_code=500, detail="No pointcloud in response")
+        pointcloud = points.tolist()
         
-        gcs = GCSHandler()
+        gcs = await run_in_stage("io", GCSHandler)
         
         file_path = None
         if file_format == "xyz":
-            local_path, filename = save_xyz_file(pointcloud)
+            local_path, filename = await run_in_stage("postprocess", save_xyz_file, pointcloud)
             file_path = f"prediction_history/xyz/{filename}"
-            download_url = gcs.upload_file(local_path, file_path)
+            download_url = await run_in_stage("io", gcs.upload_file, local_path, file_path)
         elif file_format == "ply":
-            local_path, filename = save_ply_file(pointcloud)
+            local_path, filename = await run_in_stage("postprocess", save_ply_file, pointcloud)
             file_path = f"prediction_history/ply/{filename}"
-            download_url = gcs.upload_file(local_path,file_path)            
+            download_url = await run_in_stage("io", gcs.upload_file, local_path, file_path)
         
         # test local
         
@@ -91,6 +104,7 @@ async def run_inference_pointcloud(file: UploadFile = File(...), file_format: st
             "download_url": download_url,
             "file_path": file_path, 
             "pointcloud_data": pointcloud,
+            "preprocessing": preprocessing,
             "message": "Inference completed successfully"
         }
 
@@ -104,57 +118,41 @@ async def run_upsampling_pointcloud(request: RequestUpsampling):
         if not request.file_path:
             raise HTTPException(status_code=400, detail="File path is required")
         
-        creds_token_id = service_account.IDTokenCredentials.from_service_account_file(
-            "./secrets/key.json",
-            target_audience=UPSAMPLING_URL
-        )
-        creds_token_id.refresh(auth_req)
-        TOKEN_ID = creds_token_id.token
+        TOKEN_ID = await get_id_token(UPSAMPLING_URL)
 
         file_path = request.file_path
         file_format = request.file_format
         if file_path:
-            gcs = GCSHandler()
+            gcs = await run_in_stage("io", GCSHandler)
             
             file_extension = os.path.splitext(file_path)[1]
             tmp_file = NamedTemporaryFile(delete=False, suffix=file_extension)
-            local_path, blob = gcs.download_file(file_path, tmp_file.name)
+            local_path, blob = await run_in_stage("io", gcs.download_file, file_path, tmp_file.name)
             
             if file_extension == '.xyz':
-                input_np = np.loadtxt(local_path)
+                input_np = await run_in_stage("io", np.loadtxt, local_path)
             elif file_extension == '.ply':
-                plydata = PlyData.read(local_path)
-                vertex = plydata['vertex']
-                input_np = np.column_stack((vertex['x'], vertex['y'], vertex['z']))
+                input_np = await run_in_stage("io", read_ply_points, local_path)
             else:
                 raise HTTPException(status_code=400, detail="Unsupported file format")
-            payload = {
-                "instances": [
-                    {
-                        "body": json.dumps(input_np.tolist())
-                    }
-                ]
-            }
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {TOKEN_ID}"
-            }
-            response = requests.post(f"{UPSAMPLING_URL}/predict", headers=headers, json=payload)
+            request_kwargs = tensor_request(input_np, lambda body: {"instances": [{"body": body}]})
+            request_kwargs["headers"]["Authorization"] = f"Bearer {TOKEN_ID}"
+            response = await get_service_client("upsampling").post("/predict", **request_kwargs)
             
-            data = response.json()
-            output = data.get("predictions")[0].get("point_cloud")
+            points = decode_pointcloud_response(response, lambda data: data.get("predictions")[0].get("point_cloud"))
+            output = points.tolist()
             
             if not output: 
                 raise HTTPException(status_code=500, detail="No point cloud data in response")
             file_path = None
             if file_format == "xyz":
-                local_path, filename = save_xyz_file(output)
+                local_path, filename = await run_in_stage("postprocess", save_xyz_file, output)
                 file_path = f"prediction_history/xyz/{filename}"
-                download_url = gcs.upload_file(local_path, file_path)
+                download_url = await run_in_stage("io", gcs.upload_file, local_path, file_path)
             elif file_format == "ply":
-                local_path, filename = save_ply_file(output)
+                local_path, filename = await run_in_stage("postprocess", save_ply_file, output)
                 file_path = f"prediction_history/ply/{filename}"
-                download_url = gcs.upload_file(local_path, file_path)
+                download_url = await run_in_stage("io", gcs.upload_file, local_path, file_path)
             return {
                 "download_url": download_url,
                 "file_path": file_path,
@@ -7,17 +7,17 @@ import io
 
 from fastapi import APIRouter, HTTPException, File, UploadFile
 from fastapi.responses import StreamingResponse, FileResponse
-import google.auth.transport.requests
-from google.oauth2 import service_account
 
 from schemas.request import RequestMesh
 from utils.gcs import GCSHandler
 from utils.postprocessing import taubin_smoothing, laplacian_smoothing
+from utils.executors import run_in_stage
+from utils.service_client import get_service_client
+from utils.auth import get_id_token
 
 load_dotenv()
 
 MESH_URL = os.getenv("MESH_ENDPOINT", "")
-auth_req = google.auth.transport.requests.Request()
 
 router = APIRouter(
     prefix="/process",
@@ -35,12 +35,7 @@ async def infer_mesh(request: RequestMesh):
         if not request.file_path:
             raise HTTPException(status_code=400, detail="File path is required")
         
-        creds_token_id = service_account.IDTokenCredentials.from_service_account_file(
-            "./secrets/key.json",
-            target_audience=MESH_URL
-        )
-        creds_token_id.refresh(auth_req)
-        TOKEN_ID = creds_token_id.token
+        TOKEN_ID = await get_id_token(MESH_URL)
         
         file_path = request.file_path
         payload = {
@@ -51,7 +46,7 @@ async def infer_mesh(request: RequestMesh):
             "Content-Type": "application/json",
             "Authorization": f"Bearer {TOKEN_ID}"
         }
-        response = requests.post(f"{MESH_URL}/predict", headers=headers, json=payload)
+        response = await get_service_client("mesh").post("/predict", headers=headers, json=payload)
         
         data = response.json()
         mesh_file_path = data.get("file_path")
@@ -59,20 +54,22 @@ async def infer_mesh(request: RequestMesh):
         if not mesh_file_path:
             raise HTTPException(status_code=500, detail="Mesh processing failed or no mesh file URL returned")
         
-        gcs = GCSHandler()
+        gcs = await run_in_stage("io", GCSHandler)
         
         file_extension = os.path.splitext(mesh_file_path)[1]
         tmp_file = NamedTemporaryFile(delete=False, suffix=file_extension)
-        local_path, blob = gcs.download_file(mesh_file_path, tmp_file.name)
+        local_path, blob = await run_in_stage("io", gcs.download_file, mesh_file_path, tmp_file.name)
         
         print(f"Smoothing mesh with algorithm: {request.smoothing_algorithm}")
         if request.smoothing_algorithm == "taubin":
             smoothed_path = NamedTemporaryFile(delete=False, suffix=file_extension).name
-            taubin_smoothing(local_path, smoothed_path)
+            await run_in_stage("postprocess", taubin_smoothing, local_path, smoothed_path)
             local_path = smoothed_path
         if request.smoothing_algorithm == "laplacian":
             smoothed_path = NamedTemporaryFile(delete=False, suffix=file_extension).name
-            laplacian_smoothing(local_path, smoothed_path, iterations=request.smoothing_iterations)
+            await run_in_stage(
+                "postprocess", laplacian_smoothing, local_path, smoothed_path, iterations=request.smoothing_iterations
+            )
             local_path = smoothed_path
 
         return FileResponse(
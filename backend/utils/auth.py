@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import calendar
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from dotenv import load_dotenv
+
+from utils.executors import run_in_stage
+
+load_dotenv()
+
+SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", "./secrets/key.json")
+# "google" mints real ID tokens from the service account; "local" signs stand-in tokens offline
+ID_TOKEN_SIGNER = os.getenv("ID_TOKEN_SIGNER", "google")
+ID_TOKEN_REFRESH_MARGIN_S = float(os.getenv("ID_TOKEN_REFRESH_MARGIN_S", 300))
+ID_TOKEN_RETRY_S = float(os.getenv("ID_TOKEN_RETRY_S", 10))
+
+class GoogleIDTokenSigner:
+    """
+    Mints Google-signed ID tokens for a target audience. The key file is read and parsed once.
+    """
+    def __init__(self, key_file=SERVICE_ACCOUNT_FILE):
+        import google.auth.transport.requests
+
+        with open(key_file) as f:
+            self.info = json.load(f)
+        self.request = google.auth.transport.requests.Request()
+
+    def mint(self, audience):
+        from google.oauth2 import service_account
+
+        creds = service_account.IDTokenCredentials.from_service_account_info(self.info, target_audience=audience)
+        creds.refresh(self.request)
+        # google-auth reports expiry as a naive UTC datetime
+        return creds.token, float(calendar.timegm(creds.expiry.utctimetuple()))
+
+class LocalTokenSigner:
+    """
+    Offline stand-in that signs HS256 JWTs with a local secret, for running and testing the
+    backend without a service account or network. Upstreams must not enforce Google auth.
+    """
+    def __init__(self, secret=None, lifetime_s=3600):
+        self.secret = (secret or os.getenv("LOCAL_TOKEN_SECRET") or secrets.token_hex(32)).encode()
+        self.lifetime_s = lifetime_s
+
+    def mint(self, audience):
+        now = int(time.time())
+        header = {"alg": "HS256", "typ": "JWT"}
+        payload = {"aud": audience, "iss": "local", "iat": now, "exp": now + self.lifetime_s}
+        signing_input = f"{_b64url(json.dumps(header).encode())}.{_b64url(json.dumps(payload).encode())}"
+        signature = hmac.new(self.secret, signing_input.encode(), hashlib.sha256).digest()
+        return f"{signing_input}.{_b64url(signature)}", float(payload["exp"])
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def build_signer(kind=ID_TOKEN_SIGNER):
+    if kind == "local":
+        return LocalTokenSigner()
+    if kind == "google":
+        return GoogleIDTokenSigner()
+    raise ValueError(f"Unknown ID token signer: {kind}")
+
+class IDTokenCache:
+    """
+    ID tokens keyed by target audience, refreshed in the background before they expire.
+
+    Minting runs on the io executor; request handlers only read the cache. A handler waits
+    only for an audience that was never primed, and concurrent misses share one mint.
+    """
+    def __init__(self, signer, refresh_margin_s=ID_TOKEN_REFRESH_MARGIN_S, retry_s=ID_TOKEN_RETRY_S):
+        self.signer = signer
+        self.refresh_margin_s = refresh_margin_s
+        self.retry_s = retry_s
+        self._tokens = {}  # audience -> (token, expiry epoch seconds)
+        self._pending = {}  # audience -> in-flight mint task
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self.refreshes = 0
+        self.failures = 0
+
+    async def start(self, audiences=()):
+        for audience in audiences:
+            try:
+                await self._refresh(audience)
+            except Exception as e:
+                # Keep serving; the background loop retries
+                print(f"Failed to prime ID token for {audience}: {e}")
+                self._tokens.setdefault(audience, (None, 0.0))
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def get_token(self, audience):
+        token, expiry = self._tokens.get(audience, (None, 0.0))
+        if token and expiry > time.time():
+            return token
+        return await self._refresh(audience)
+
+    async def _refresh(self, audience):
+        if audience not in self._pending:
+            self._pending[audience] = asyncio.create_task(self._mint(audience))
+        try:
+            return await asyncio.shield(self._pending[audience])
+        finally:
+            if audience in self._pending and self._pending[audience].done():
+                del self._pending[audience]
+
+    async def _mint(self, audience):
+        try:
+            token, expiry = await run_in_stage("io", self.signer.mint, audience)
+        except Exception:
+            self.failures += 1
+            raise
+        self.refreshes += 1
+        self._tokens[audience] = (token, expiry)
+        self._wakeup.set()
+        return token
+
+    async def _refresh_loop(self):
+        while True:
+            now = time.time()
+            due = [a for a, (_, expiry) in self._tokens.items() if expiry - self.refresh_margin_s <= now]
+            for audience in due:
+                try:
+                    await self._refresh(audience)
+                except Exception as e:
+                    print(f"Failed to refresh ID token for {audience}: {e}")
+            next_refresh = min(
+                (expiry - self.refresh_margin_s for _, expiry in self._tokens.values()),
+                default=now + self.retry_s,
+            )
+            delay = max(next_refresh - time.time(), self.retry_s if due else 0.0, 1.0)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        now = time.time()
+        return {
+            "signer": type(self.signer).__name__,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "expires_in_s": {audience: expiry - now for audience, (_, expiry) in self._tokens.items()},
+        }
+
+
+_cache = None
+
+async def init_token_cache(audiences=(), signer=None):
+    """
+    Create the process-wide token cache, prime it for `audiences` and start background refresh.
+    """
+    global _cache
+    if _cache is None:
+        _cache = IDTokenCache(signer or build_signer())
+        await _cache.start([a for a in audiences if a])
+    return _cache
+
+async def close_token_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.stop()
+        _cache = None
+
+async def get_id_token(audience):
+    if _cache is None:
+        await init_token_cache()
+    return await _cache.get_token(audience)
+
+def token_cache_stats():
+    return _cache.stats() if _cache is not None else {}
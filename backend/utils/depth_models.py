@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+from scipy import ndimage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MIDAS_HUB_REPO = "intel-isl/MiDaS"
+MIDAS_MODEL_TYPES = ("DPT_Large", "DPT_Hybrid", "MiDaS", "MiDaS_small")
+MIDAS_MODEL_DIR = os.getenv("MIDAS_MODEL_DIR", "./models/midas")
+MIDAS_ALLOW_HUB = os.getenv("MIDAS_ALLOW_HUB", "false").lower() == "true"
+
+# Comma separated backends to load, ordered from most to least accurate. MiDaS backends
+# without an exported artifact are skipped with a warning, unless selected by DEPTH_BACKEND
+DEPTH_BACKENDS = [b.strip() for b in os.getenv("DEPTH_BACKENDS", "DPT_Hybrid,silhouette").split(",") if b.strip()]
+DEPTH_BACKEND = os.getenv("DEPTH_BACKEND", "")
+DEPTH_LATENCY_BUDGET_MS = float(os.getenv("DEPTH_LATENCY_BUDGET_MS", 0)) or None
+
+def midas_artifact_path(model_type, resize=(128, 128), model_dir=None):
+    """
+    Location of the vendored MiDaS artifact for a model type and input size.
+    """
+    return os.path.join(model_dir or MIDAS_MODEL_DIR, f"{model_type}_{resize[0]}x{resize[1]}.pt")
+
+def export_midas(model_type, resize=(128, 128), model_dir=None, device="cpu"):
+    """
+    Resolve MiDaS through torch.hub once (at build time) and save a traced copy to the
+    local registry. The Preprocessor always feeds MiDaS a fixed `resize` input, so the
+    traced graph is equivalent to the eager model and needs neither hub nor timm to load.
+
+    Args:
+        model_type (str): One of MIDAS_MODEL_TYPES.
+        resize (tuple): Input (height, width) the artifact is traced for.
+        model_dir (str): Registry directory. Defaults to MIDAS_MODEL_DIR.
+        device (str): Device to trace on; use the device type the artifact will be served on.
+    """
+    if model_type not in MIDAS_MODEL_TYPES:
+        raise ValueError(f"Unsupported MiDaS model type: {model_type}")
+    model = torch.hub.load(MIDAS_HUB_REPO, model_type).to(device).eval()
+    example = torch.rand(1, 3, *resize, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+
+    path = midas_artifact_path(model_type, resize, model_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    traced.save(path)
+    print(f"-----Exported {model_type} to {path}-----")
+    return path
+
+def load_midas(model_type, device, resize=(128, 128), model_dir=None, allow_hub=None):
+    """
+    Load a MiDaS depth estimator from the local registry without touching torch.hub.
+
+    Falls back to torch.hub only when `allow_hub` (or MIDAS_ALLOW_HUB) is set, so a missing
+    artifact fails fast at startup instead of silently depending on the network.
+
+    Returns:
+        tuple: (model, source) where source is "local" or "hub".
+    """
+    if model_type not in MIDAS_MODEL_TYPES:
+        raise ValueError(f"Unsupported MiDaS model type: {model_type}")
+    allow_hub = MIDAS_ALLOW_HUB if allow_hub is None else allow_hub
+
+    path = midas_artifact_path(model_type, resize, model_dir)
+    if os.path.isfile(path):
+        print(f"-----Loading {model_type} from {path}-----")
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        return model, "local"
+
+    if not allow_hub:
+        raise FileNotFoundError(
+            f"No local MiDaS artifact at {path}. Run `python -m utils.depth_models export "
+            f"--model-type {model_type}` or set MIDAS_ALLOW_HUB=true."
+        )
+    print(f"-----No local artifact for {model_type}, resolving through torch.hub-----")
+    model = torch.hub.load(MIDAS_HUB_REPO, model_type)
+    model.to(device)
+    model.eval()
+    return model, "hub"
+
+def time_to_ready(model_type, device, resize=(128, 128), model_dir=None, allow_hub=None):
+    """
+    Measure cold start of a MiDaS model: load time plus the first forward pass.
+    """
+    start = time.perf_counter()
+    model, source = load_midas(model_type, device, resize, model_dir, allow_hub)
+    load_time = time.perf_counter() - start
+
+    with torch.no_grad():
+        model(torch.rand(1, 3, *resize, device=device))
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+    ready_time = time.perf_counter() - start
+    return {
+        "model_type": model_type,
+        "source": source,
+        "device": str(device),
+        "load_time_s": load_time,
+        "time_to_ready_s": ready_time,
+    }
+
+
+class MidasDepthBackend:
+    """
+    Relative inverse depth from a MiDaS model in the local registry.
+    """
+    def __init__(self, model_type, device, resize=(128, 128)):
+        self.name = model_type
+        self.device = device
+        self.model, self.source = load_midas(model_type, device, resize)
+        self.latency_ms = None
+        self._lock = threading.Lock()
+
+    def predict(self, image_tensor):
+        """
+        Args:
+            image_tensor (torch.Tensor): (1, 3, H, W) RGB tensor in [0, 1], background zeroed.
+
+        Returns:
+            np.ndarray: (H, W) unnormalized inverse depth.
+        """
+        with self._lock, torch.no_grad():
+            depth = self.model(image_tensor.to(self.device))
+        return depth.squeeze().cpu().numpy()
+
+class SilhouetteDepthBackend:
+    """
+    Cheap CPU fallback without a network: treats the foreground as a rounded bulge
+    towards the camera, using the distance of each pixel to the silhouette edge.
+    """
+    def __init__(self, device=None, resize=(128, 128)):
+        self.name = "silhouette"
+        self.source = "builtin"
+        self.latency_ms = None
+
+    def predict(self, image_tensor):
+        mask = image_tensor.squeeze(0).amax(dim=0).cpu().numpy() > 0
+        return np.sqrt(ndimage.distance_transform_edt(mask)).astype(np.float32)
+
+def build_depth_backend(name, device, resize=(128, 128)):
+    """
+    Instantiate a depth backend by registry name: any of MIDAS_MODEL_TYPES, or "silhouette".
+    """
+    if name == "silhouette":
+        return SilhouetteDepthBackend(device, resize)
+    if name in MIDAS_MODEL_TYPES:
+        return MidasDepthBackend(name, device, resize)
+    raise ValueError(f"Unknown depth backend: {name}")
+
+def select_depth_backend(backends, name=None, latency_budget_ms=None):
+    """
+    Pick a loaded depth backend.
+
+    Args:
+        backends (dict): Loaded backends keyed by name, ordered from most to least accurate.
+        name (str): Explicit backend; wins over the latency budget.
+        latency_budget_ms (float): Choose the most accurate backend whose measured latency
+            fits the budget, or the fastest one when none does.
+    """
+    if name:
+        if name not in backends:
+            raise ValueError(f"Depth backend '{name}' is not loaded. Available: {list(backends)}")
+        return backends[name]
+    if latency_budget_ms:
+        measured = [b for b in backends.values() if b.latency_ms is not None]
+        for backend in measured:
+            if backend.latency_ms <= latency_budget_ms:
+                return backend
+        if measured:
+            return min(measured, key=lambda b: b.latency_ms)
+    return next(iter(backends.values()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the local MiDaS model registry.")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model-type", default="DPT_Hybrid", choices=MIDAS_MODEL_TYPES)
+    parser.add_argument("--size", type=int, nargs=2, default=(128, 128), metavar=("H", "W"))
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    export_midas(args.model_type, tuple(args.size), args.model_dir, args.device)
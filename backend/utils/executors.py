@@ -0,0 +1,91 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# stage -> (executor kind, max concurrent jobs)
+STAGES = {
+    # rembg + depth estimation; always threads, since the models live in this process and
+    # release the GIL inside ONNX Runtime / torch
+    "preprocess": ("thread", int(os.getenv("PREPROCESS_CONCURRENCY", 2))),
+    # open3d smoothing and point cloud file writing
+    "postprocess": (os.getenv("POSTPROCESS_EXECUTOR", "thread"), int(os.getenv("POSTPROCESS_CONCURRENCY", 2))),
+    # blocking network and disk I/O: GCS transfers, token minting, file parsing; always
+    # threads, since callers pass GCS clients and bound methods, which cannot be pickled
+    "io": ("thread", int(os.getenv("IO_CONCURRENCY", 16))),
+}
+
+class StageExecutor:
+    """
+    A thread or process pool for one pipeline stage. Jobs beyond `concurrency` wait on a
+    semaphore in the event loop instead of piling up inside the pool, so waiting is cheap
+    and observable.
+    """
+    def __init__(self, name, kind="thread", concurrency=1):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind for stage '{name}': {kind}")
+        self.name = name
+        self.kind = kind
+        self.concurrency = concurrency
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"stage-{name}")
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, fn, *args, **kwargs):
+        self.waiting += 1
+        async with self._semaphore:
+            self.waiting -= 1
+            self.running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+            finally:
+                self.running -= 1
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+_executors = {}
+
+def init_executors(stages=None):
+    """
+    Create one executor per stage. Must be called from the event loop (app lifespan).
+    """
+    for name, (kind, concurrency) in (stages or STAGES).items():
+        if name not in _executors:
+            _executors[name] = StageExecutor(name, kind, concurrency)
+    return _executors
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+async def run_in_stage(stage, fn, *args, **kwargs):
+    """
+    Run a blocking callable on the stage's pool without blocking the event loop.
+    Process-pool stages need `fn` and its arguments to be picklable.
+    """
+    if stage not in _executors:
+        init_executors()
+    return await _executors[stage].run(fn, *args, **kwargs)
+
+def executor_stats():
+    return {name: executor.stats() for name, executor in _executors.items()}
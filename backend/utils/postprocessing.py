@@ -2,6 +2,7 @@ from tempfile import NamedTemporaryFile
 import os
 import open3d as o3d
 import numpy as np
+from plyfile import PlyData
 
 def save_xyz_file(pointcloud_data):
     """
@@ -30,6 +31,14 @@ def save_ply_file(pointcloud_data):
     
     return tmp_file.name, os.path.basename(tmp_file.name)
 
+def read_ply_points(path):
+    """
+    Read the vertex positions of a .ply point cloud as an (N, 3) array.
+    """
+    plydata = PlyData.read(path)
+    vertex = plydata['vertex']
+    return np.column_stack((vertex['x'], vertex['y'], vertex['z']))
+
 def taubin_smoothing(input_path, output_path, iterations=20, lambda_val=0.5, mu_val=-0.53):
     mesh = o3d.io.read_triangle_mesh(input_path)
     if len(mesh.vertices) == 0 or np.any(np.isnan(np.asarray(mesh.vertices))):
@@ -1,22 +1,126 @@
 from PIL import Image
-import numpy as np  
+import numpy as np
 import torch
 from torchvision import transforms
 import io
-from rembg import remove
+import math
+import os
+import threading
+import time
+from rembg import remove, new_session
+
+from utils.depth_models import (
+    DEPTH_BACKEND,
+    DEPTH_BACKENDS,
+    DEPTH_LATENCY_BUDGET_MS,
+    build_depth_backend,
+    select_depth_backend,
+)
+
+# Longest side rembg segments at; the mask is upsampled back to the input size. 0 disables the cap
+REMBG_MAX_SIDE = int(os.getenv("REMBG_MAX_SIDE", 1024))
+# Alpha channels are trusted as a segmentation when the opaque share of the image falls in
+# [ALPHA_MIN_COVERAGE, ALPHA_MAX_COVERAGE] and few pixels are semi-transparent
+ALPHA_MIN_COVERAGE = float(os.getenv("ALPHA_MIN_COVERAGE", 0.01))
+ALPHA_MAX_COVERAGE = float(os.getenv("ALPHA_MAX_COVERAGE", 0.99))
+ALPHA_MAX_SOFT_FRACTION = float(os.getenv("ALPHA_MAX_SOFT_FRACTION", 0.05))
+
+def decode_image(image_bytes, working_side=None):
+    """
+    Open an encoded upload, letting the JPEG decoder downscale while decoding.
+
+    For JPEGs, `draft` selects the largest DCT scale (1/2, 1/4, 1/8) whose output still has a
+    longest side of at least `working_side`, so the full-resolution buffer is never allocated.
+    Other formats (and `working_side=None`) decode at full size.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if working_side and image.format == "JPEG" and max(image.size) > working_side:
+        w, h = image.size
+        ratio = working_side / max(w, h)
+        image.draft(None, (math.ceil(w * ratio), math.ceil(h * ratio)))
+    return image
+
+def usable_alpha(image):
+    """
+    Return the alpha channel of `image` if it looks like a clean foreground mask, else None.
+
+    A usable alpha is neither (almost) fully opaque nor (almost) fully transparent, and only
+    a small fraction of its pixels are semi-transparent (anti-aliased edges are fine, soft
+    gradients or vignettes are not).
+    """
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode not in ("RGBA", "LA", "PA"):
+        return None
+    alpha = image.getchannel("A")
+    histogram = alpha.histogram()
+    total = sum(histogram)
+    coverage = sum(histogram[128:]) / total
+    soft = sum(histogram[16:240]) / total
+    if ALPHA_MIN_COVERAGE <= coverage <= ALPHA_MAX_COVERAGE and soft <= ALPHA_MAX_SOFT_FRACTION:
+        return alpha
+    return None
+
+def segmentation_mask(image, session, max_side=None):
+    """
+    Foreground mask ("L", same size as `image`) from rembg, segmenting at most at `max_side`.
+    """
+    if not max_side or max(image.size) <= max_side:
+        return remove(image, session=session, only_mask=True)
+    small = image.copy()
+    small.thumbnail((max_side, max_side), Image.BILINEAR)
+    mask = remove(small, session=session, only_mask=True)
+    return mask.resize(image.size, Image.BILINEAR)
+
+def remove_background(image, session, max_side=None):
+    """
+    Composite `image` onto black using the rembg foreground mask.
+
+    With `max_side` unset (or the image already small enough) this is the plain full-resolution
+    `rembg.remove` path; otherwise segmentation runs on a downscaled copy and only the
+    upsampled mask touches the full-resolution pixels.
+    """
+    if not max_side or max(image.size) <= max_side:
+        return remove(image, session=session).convert("RGB")
+    mask = segmentation_mask(image, session, max_side)
+    return Image.composite(image.convert("RGB"), Image.new("RGB", image.size, 0), mask)
 
 class Preprocessor:
-    def __init__(self, device=None, model_type="DPT_Hybrid", resize=(128, 128)):
+    def __init__(self, device=None, model_type=None, resize=(128, 128), rembg_model="u2net",
+                 depth_backends=None, latency_budget_ms=DEPTH_LATENCY_BUDGET_MS, warmup_runs=3,
+                 segmentation_max_side=REMBG_MAX_SIDE):
+        start = time.perf_counter()
+        self.ready = False
         self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model_type = model_type
+        self.model_type = model_type or DEPTH_BACKEND or None
         self.resize = resize
+        self.latency_budget_ms = latency_budget_ms
+        self.warmup_runs = warmup_runs
+        self.segmentation_max_side = segmentation_max_side
+        # Smallest decode size that still feeds segmentation and the model at full quality
+        self.working_side = max(segmentation_max_side, *resize) if segmentation_max_side else None
 
-        self.midas = torch.hub.load("intel-isl/MiDaS", self.model_type)
-        self.midas.to(self.device)
-        self.midas.eval()
+        names = list(depth_backends or DEPTH_BACKENDS)
+        if self.model_type and self.model_type not in names:
+            names.insert(0, self.model_type)
+        self.depth_backends = {}
+        for name in names:
+            try:
+                self.depth_backends[name] = build_depth_backend(name, self.device, self.resize)
+            except FileNotFoundError as e:
+                # Only an explicitly selected backend is required; the rest are optional
+                if name == self.model_type:
+                    raise
+                print(f"-----Skipping depth backend {name}: {e}-----")
+        if not self.depth_backends:
+            raise RuntimeError(f"None of the depth backends {names} could be loaded")
 
+        self.rembg_session = new_session(rembg_model)
         self.transform = self._build_transform(['resize', 'totensor'], self.resize)
 
+        self.load_time = time.perf_counter() - start
+        self.warmup_time = None
+
     def _build_transform(self, preprocess_list, resize):
         preprocess = []
         if 'grayscale' in preprocess_list:
@@ -27,41 +131,147 @@ class Preprocessor:
             preprocess.append(transforms.ToTensor())
         return transforms.Compose(preprocess)
 
-    def process(self, image_input):
+    def warmup(self):
+        """
+        Run a dummy image through the whole pipeline so the first request does not pay
+        for lazy initialization (ONNX session, cuDNN autotuning, allocator growth).
+        """
+        print("-----Warming up preprocessor...-----")
+        start = time.perf_counter()
+        dummy = Image.new("RGB", (self.resize[1] * 2, self.resize[0] * 2), (127, 127, 127))
+        for name in self.depth_backends:
+            self.process(dummy, depth_backend=name)
+
+        # Measured latencies drive latency-budget selection
+        dummy_tensor = self.transform(self.background_removal(dummy)).unsqueeze(0)
+        for backend in self.depth_backends.values():
+            timings = []
+            for _ in range(self.warmup_runs):
+                t0 = time.perf_counter()
+                backend.predict(dummy_tensor)
+                timings.append((time.perf_counter() - t0) * 1000)
+            backend.latency_ms = float(np.median(timings))
+        self.warmup_time = time.perf_counter() - start
+        self.ready = True
+        print(f"-----Preprocessor ready (load {self.load_time:.2f}s, warmup {self.warmup_time:.2f}s)-----")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "default_depth_backend": self.select_depth_backend().name,
+            "latency_budget_ms": self.latency_budget_ms,
+            "segmentation_max_side": self.segmentation_max_side,
+            "depth_backends": {
+                name: {"source": backend.source, "latency_ms": backend.latency_ms}
+                for name, backend in self.depth_backends.items()
+            },
+            "device": str(self.device),
+            "load_time_s": self.load_time,
+            "warmup_time_s": self.warmup_time,
+        }
+
+    def select_depth_backend(self, name=None, latency_budget_ms=None):
+        """
+        Resolve the depth backend for a request: explicit name, then the request's latency
+        budget, then the deployment default (DEPTH_BACKEND / model_type / latency budget).
+        """
+        if name or latency_budget_ms:
+            return select_depth_backend(self.depth_backends, name, latency_budget_ms)
+        return select_depth_backend(self.depth_backends, self.model_type, self.latency_budget_ms)
+
+    def process(self, image_input, depth_backend=None, latency_budget_ms=None, return_info=False):
         """
         image_input: bytes (from API) or PIL.Image.Image
+        depth_backend: name of a loaded depth backend, overrides the deployment default
+        latency_budget_ms: pick the most accurate depth backend within this budget
+        return_info: also return a dict describing the segmentation path and depth backend used
         """
+        backend = self.select_depth_backend(depth_backend, latency_budget_ms)
+
         if isinstance(image_input, bytes):
-            image = Image.open(io.BytesIO(image_input)).convert("RGB")
+            image = decode_image(image_input, self.working_side)
         elif isinstance(image_input, Image.Image):
-            image = image_input.convert("RGB")
+            image = image_input
         else:
             raise TypeError("image_input must be bytes or PIL.Image.Image")
-        
-        image = self.background_removal(image)
+
+        alpha = usable_alpha(image)
+        if alpha is not None:
+            # Pre-segmented upload: the alpha channel is the mask, skip rembg entirely
+            print("-----Using alpha channel as mask-----")
+            segmentation = "alpha"
+            image = Image.composite(image.convert("RGB"), Image.new("RGB", image.size, 0), alpha)
+        else:
+            image = image.convert("RGB")
+            max_side = self.segmentation_max_side
+            segmentation = "rembg_capped" if max_side and max(image.size) > max_side else "rembg"
+            image = self.background_removal(image)
         print("-----Transforming image-----")
         transformed_image = self.transform(image)
         transformed_image_np = transformed_image.numpy()
-        transformed_image = transformed_image.unsqueeze(0).to(self.device)
 
-        with torch.no_grad():
-            depth_prediction = self.midas(transformed_image)
-        depth_prediction = depth_prediction.squeeze().cpu().numpy()
-        depth_prediction = (depth_prediction - depth_prediction.min()) / (depth_prediction.max() - depth_prediction.min())
+        print(f"-----Estimating depth with {backend.name}-----")
+        depth_prediction = backend.predict(transformed_image.unsqueeze(0))
+        depth_range = depth_prediction.max() - depth_prediction.min()
+        if depth_range > 0:
+            depth_prediction = (depth_prediction - depth_prediction.min()) / depth_range
+        else:
+            depth_prediction = np.zeros_like(depth_prediction)
         depth_pil = Image.fromarray((depth_prediction * 255).astype(np.uint8))
 
         depth_map = self.transform(depth_pil).numpy()
         depth_map_np = depth_map.squeeze()
 
         combined = np.concatenate((transformed_image_np, depth_map_np[None, :, :]), axis=0)
+        if return_info:
+            return combined, {
+                "segmentation": segmentation,
+                "depth_backend": backend.name,
+                "decoded_size": image.size,
+            }
         return combined
-    
-    def background_removal(self, image_input):
+
+    def background_removal(self, image_input, max_side=None):
         """Remove background from raw image
 
         Args:
-            image_input (_type_): _description_
+            image_input (PIL.Image.Image): RGB image at upload resolution.
+            max_side (int): Segmentation resolution cap, defaults to `segmentation_max_side`.
+                0 forces the full-resolution path.
         """
         print("-----Removing background...-----")
-        no_bg = remove(image_input)
-        return no_bg.convert("RGB")
\ No newline at end of file
+        max_side = self.segmentation_max_side if max_side is None else max_side
+        return remove_background(image_input, self.rembg_session, max_side)
+
+
+_preprocessor = None
+_preprocessor_lock = threading.Lock()
+
+def init_preprocessor(**kwargs):
+    """
+    Create and warm the process-wide Preprocessor. Safe to call more than once;
+    only the first call loads the models.
+    """
+    global _preprocessor
+    with _preprocessor_lock:
+        if _preprocessor is None:
+            preprocessor = Preprocessor(**kwargs)
+            preprocessor.warmup()
+            _preprocessor = preprocessor
+    return _preprocessor
+
+def get_preprocessor():
+    """
+    Return the shared Preprocessor, loading it on first use if the app startup hook has not run.
+    """
+    if _preprocessor is not None:
+        return _preprocessor
+    return init_preprocessor()
+
+def preprocessor_status():
+    """
+    Readiness of the shared Preprocessor, without triggering a load.
+    """
+    if _preprocessor is None:
+        return {"ready": False}
+    return _preprocessor.status()
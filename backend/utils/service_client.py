@@ -0,0 +1,126 @@
+import asyncio
+import os
+import random
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# service -> (base URL, read timeout in seconds for that stage)
+SERVICES = {
+    "main": (os.getenv("MAIN_MODEL_ENDPOINT", ""), float(os.getenv("MAIN_TIMEOUT_S", 60))),
+    "upsampling": (os.getenv("UPSAMPLING_ENDPOINT", ""), float(os.getenv("UPSAMPLING_TIMEOUT_S", 300))),
+    "mesh": (os.getenv("MESH_ENDPOINT", ""), float(os.getenv("MESH_TIMEOUT_S", 600))),
+}
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", 10))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 16))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 8))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+HTTP_RETRY_BACKOFF_S = float(os.getenv("HTTP_RETRY_BACKOFF_S", 0.5))
+
+# Only failures where the upstream did not start (or refused) the work are retried;
+# a read timeout may mean the model is still busy with the request
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+RETRY_STATUS = {429, 502, 503, 504}
+
+class ServiceClient:
+    """
+    A keep-alive connection pool to one model service, with bounded retries and pool metrics.
+    """
+    def __init__(self, name, base_url, timeout, max_connections=HTTP_MAX_CONNECTIONS,
+                 max_keepalive=HTTP_MAX_KEEPALIVE, max_retries=HTTP_MAX_RETRIES, backoff=HTTP_RETRY_BACKOFF_S):
+        self.name = name
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+        # Mirrors the pool limit so waiting for a connection is counted here, not hidden in httpx
+        self._slots = asyncio.Semaphore(max_connections)
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_time_s = 0.0
+
+    async def request(self, method, path, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._send(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    return response
+                print(f"-----{self.name} returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})-----")
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise
+                print(f"-----{self.name} request failed ({e!r}), retrying ({attempt + 1}/{self.max_retries})-----")
+            self.retries += 1
+            # Exponential backoff with full jitter
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def _send(self, method, path, **kwargs):
+        self.waiting += 1
+        start = time.perf_counter()
+        async with self._slots:
+            self.waiting -= 1
+            self.wait_time_s += time.perf_counter() - start
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.requests += 1
+            try:
+                return await self.client.request(method, path, **kwargs)
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "saturation": self.in_flight / self.max_connections,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "total_wait_s": self.wait_time_s,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+
+def init_service_clients(services=None):
+    """
+    Create one pooled client per upstream service. Must be called from the event loop (app lifespan).
+    """
+    for name, (base_url, timeout) in (services or SERVICES).items():
+        if name not in _clients:
+            _clients[name] = ServiceClient(name, base_url, timeout)
+    return _clients
+
+async def close_service_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+def get_service_client(name):
+    if name not in _clients:
+        init_service_clients()
+    return _clients[name]
+
+def service_client_stats():
+    return {name: client.stats() for name, client in _clients.items()}
@@ -0,0 +1,75 @@
+import io
+import json
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NPY_CONTENT_TYPE = "application/x-npy"
+# Format for tensors sent to the model services: "npy" (binary) or "json" (legacy)
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "npy")
+# Send uploads as encoded images to the main model service's /predict_image, which segments
+# and estimates depth itself, instead of preprocessing here and sending the RGB-D tensor
+PREPROCESS_REMOTE = os.getenv("PREPROCESS_REMOTE", "false").lower() == "true"
+
+def encode_array(array):
+    """
+    Serialize an array as a little-endian float32 .npy payload (shape and dtype in the header).
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype="<f4"), allow_pickle=False)
+    return buffer.getvalue()
+
+def decode_array(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+def is_npy(content_type):
+    return (content_type or "").split(";")[0].strip() == NPY_CONTENT_TYPE
+
+def tensor_request(array, json_body, wire_format=WIRE_FORMAT):
+    """
+    Keyword arguments for an httpx request carrying `array`.
+
+    Args:
+        array (np.ndarray): Tensor to send.
+        json_body (callable): Builds the legacy JSON body from the JSON-encoded tensor string.
+        wire_format (str): "npy" sends raw .npy bytes and asks for a binary response.
+    """
+    if wire_format == "npy":
+        return {
+            "content": encode_array(array),
+            "headers": {"Content-Type": NPY_CONTENT_TYPE, "Accept": f"{NPY_CONTENT_TYPE}, application/json"},
+        }
+    return {
+        "json": json_body(json.dumps(array.tolist())),
+        "headers": {"Content-Type": "application/json"},
+    }
+
+def image_request(image_bytes, content_type, wire_format=WIRE_FORMAT):
+    """
+    Keyword arguments for an httpx request carrying an encoded image to /predict_image.
+    """
+    accept = f"{NPY_CONTENT_TYPE}, application/json" if wire_format == "npy" else "application/json"
+    return {"content": image_bytes, "headers": {"Content-Type": content_type, "Accept": accept}}
+
+def preprocessing_info(response):
+    """
+    Preprocessing details reported by /predict_image, in either response format.
+    """
+    if is_npy(response.headers.get("content-type")):
+        return json.loads(response.headers.get("x-preprocessing", "{}"))
+    return response.json().get("preprocessing", {})
+
+def decode_pointcloud_response(response, extract_json):
+    """
+    Point cloud from a model service response, whichever format the service answered in.
+
+    Args:
+        response (httpx.Response): Upstream response.
+        extract_json (callable): Pulls the point list out of the legacy JSON body.
+    """
+    if is_npy(response.headers.get("content-type")):
+        return decode_array(response.content)
+    return np.asarray(extract_json(response.json()), dtype=np.float32)
@@ -11,6 +11,8 @@ import trimesh
 
 from model import PUGeo, UDF
 from utils import download_from_gcs, get_nn_dist, get_udf, custom_marching_cube, upload_to_gcs
+from wire import decode_array, is_npy
+from checkpoint import ReadyTimer, load_checkpoint, load_weights
 
 app = FastAPI()
 
@@ -28,20 +30,21 @@ udf_model = None
 def startup_event():
     global pu_model, udf_model
     try:
-        pu_model = PUGeo(knn=20)
-        pu_model = nn.DataParallel(pu_model)
-        pu_model = pu_model.cuda()
-        pu_model.load_state_dict(torch.load(os.path.join(weights_path,'pu_model_best.t7')))
-        print("[INFO] PU model loaded successfully.")
-
-        udf_model = UDF()
-        udf_model = nn.DataParallel(udf_model)
-        udf_model = udf_model.cuda()
-        udf_model.load_state_dict(torch.load(os.path.join(weights_path,'udf_model_best.t7')))
-        print("[INFO] UDF model loaded successfully.")
-
-        pu_model.eval()
-        udf_model.eval()
+        with ReadyTimer("GeoUDF"):
+            pu_model = PUGeo(knn=20)
+            pu_model = nn.DataParallel(pu_model)
+            pu_model = pu_model.cuda()
+            load_weights(pu_model, load_checkpoint(os.path.join(weights_path,'pu_model_best.t7')), "cuda")
+            print("[INFO] PU model loaded successfully.")
+
+            udf_model = UDF()
+            udf_model = nn.DataParallel(udf_model)
+            udf_model = udf_model.cuda()
+            load_weights(udf_model, load_checkpoint(os.path.join(weights_path,'udf_model_best.t7')), "cuda")
+            print("[INFO] UDF model loaded successfully.")
+
+            pu_model.eval()
+            udf_model.eval()
         print("[INFO] ✅ Initialization complete.")
     except Exception as e:
         print(f"[ERROR] Failed to load models: {e}")
@@ -55,19 +58,25 @@ def health():
 @app.post(os.environ['AIP_PREDICT_ROUTE'])
 async def predict(request: Request):
     try:
-        body = await request.json()
-        print(f"[INFO] Receiving prediction request... : {body}")
-        file_path = body.get("file_path")
-        res = body.get("res", 128)  # default 128, options are [128, 192]
-        if not file_path:
-            raise HTTPException(status_code=400, detail="file_path is required")
-        file_extension = os.path.splitext(file_path)[1].lower()
-        if file_extension != '.ply':
-            raise HTTPException(status_code=400, detail="Only .ply files are supported")
-        input_path = download_from_gcs(file_path, destination_path="temp")
-
         ms_set = pymeshlab.MeshSet()
-        ms_set.load_new_mesh(input_path)
+        if is_npy(request.headers.get("content-type")):
+            # Binary path: the body is the (N, 3) point cloud itself, no GCS round-trip
+            points = decode_array(await request.body()).astype(np.float64)
+            res = int(request.query_params.get("res", 128))
+            print(f"[INFO] Receiving prediction request... : npy {points.shape}")
+            ms_set.add_mesh(pymeshlab.Mesh(vertex_matrix=points[:, :3]))
+        else:
+            body = await request.json()
+            print(f"[INFO] Receiving prediction request... : {body}")
+            file_path = body.get("file_path")
+            res = body.get("res", 128)  # default 128, options are [128, 192]
+            if not file_path:
+                raise HTTPException(status_code=400, detail="file_path is required")
+            file_extension = os.path.splitext(file_path)[1].lower()
+            if file_extension != '.ply':
+                raise HTTPException(status_code=400, detail="Only .ply files are supported")
+            input_path = download_from_gcs(file_path, destination_path="temp")
+            ms_set.load_new_mesh(input_path)
         ms_set.compute_normal_for_point_clouds()
 
         sparse_pc=np.array(ms_set.current_mesh().vertex_matrix())
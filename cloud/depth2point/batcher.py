@@ -0,0 +1,143 @@
+import asyncio
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batched forward passes.
+
+    The first queued request opens a batch; it is closed when `max_batch_size` requests have
+    joined or `max_delay_ms` has passed, then run on a single worker thread so the event loop
+    keeps accepting requests while the model computes.
+    """
+    def __init__(self, run_batch, max_batch_size=8, max_delay_ms=5.0, window=1000):
+        self.run_batch = run_batch  # np.ndarray (B, ...) -> np.ndarray (B, ...)
+        self.max_batch_size = max_batch_size
+        self.max_delay_s = max_delay_ms / 1000
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self.batches = 0
+        self.requests = 0
+        self.direct_batches = 0
+        self.direct_items = 0
+        self._batch_sizes = collections.deque(maxlen=window)
+        self._queue_wait = collections.deque(maxlen=window)
+        self._compute = collections.deque(maxlen=window)
+        # Pre-stacked batches from `run` are timed apart, so coalescing stats stay comparable
+        self._direct_compute = collections.deque(maxlen=window)
+
+    async def submit(self, item):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            try:
+                inputs = np.stack([item for item, _, _ in batch])
+                outputs = await loop.run_in_executor(self._executor, self.run_batch, inputs)
+            except Exception as e:
+                if len(batch) == 1:
+                    _, future, _ = batch[0]
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                # One bad item must not fail the requests coalesced with it: retry them one by one
+                print(f"[WARN] Batch of {len(batch)} failed ({e}), running its items one by one")
+                await self._run_each(batch)
+                continue
+            finished = time.perf_counter()
+
+            self.batches += 1
+            self.requests += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._compute.append(finished - started)
+            for (_, future, enqueued), output in zip(batch, outputs):
+                self._queue_wait.append(started - enqueued)
+                if not future.done():
+                    future.set_result(output)
+
+    async def _run_each(self, batch):
+        loop = asyncio.get_running_loop()
+        for item, future, enqueued in batch:
+            started = time.perf_counter()
+            try:
+                output = (await loop.run_in_executor(self._executor, self.run_batch, item[None]))[0]
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += 1
+            self._batch_sizes.append(1)
+            self._queue_wait.append(started - enqueued)
+            self._compute.append(time.perf_counter() - started)
+            if not future.done():
+                future.set_result(output)
+
+    async def run(self, inputs):
+        """
+        Run an already stacked batch on the batcher's worker thread, bypassing coalescing, so
+        bulk callers share the model with /predict traffic instead of competing with it.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outputs = await loop.run_in_executor(self._executor, self.run_batch, inputs)
+        self.direct_batches += 1
+        self.direct_items += len(inputs)
+        self._direct_compute.append(time.perf_counter() - started)
+        return outputs
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return {}
+            p50, p99 = np.percentile(samples, [50, 99])
+            return {"mean_ms": float(np.mean(samples)) * 1000, "p50_ms": float(p50) * 1000, "p99_ms": float(p99) * 1000}
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_delay_ms": self.max_delay_s * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "direct_batches": self.direct_batches,
+            "direct_items": self.direct_items,
+            "mean_batch_size": float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_wait": summary(self._queue_wait),
+            "compute": summary(self._compute),
+            "direct_compute": summary(self._direct_compute),
+        }
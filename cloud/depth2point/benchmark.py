@@ -0,0 +1,238 @@
+"""
+Benchmarks for the Depth2Point service.
+
+Usage:
+    python benchmark.py precision --model model.pt --inputs rgbd_0.npy rgbd_1.npy --reference cloud_0.xyz cloud_1.xyz
+    python benchmark.py runtime --runtime eager torchscript onnx --threads 1 2 4
+    python benchmark.py batching --model model.pt --concurrency 16 --max-batch-size 1 4 8 16
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import torch
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+def chamfer_distance(a, b):
+    """
+    Symmetric Chamfer distance (mean squared nearest-neighbour distance, both directions).
+    """
+    a = torch.as_tensor(a, dtype=torch.float32)
+    b = torch.as_tensor(b, dtype=torch.float32)
+    d = torch.cdist(a, b) ** 2
+    return (d.min(dim=1).values.mean() + d.min(dim=0).values.mean()).item()
+
+def _load_inputs(paths, count):
+    if paths:
+        return np.stack([np.load(p).astype(np.float32) for p in paths])
+    rng = np.random.default_rng(0)
+    return rng.random((count, 4, 128, 128), dtype=np.float32)
+
+def _run_precision(model_path, precision, inputs, repeat):
+    from model import load_model
+    from precision import input_dtype
+
+    device = torch.device("cuda" if torch.cuda.is_available() and precision != "int8" else "cpu")
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    model = load_model(model_path, device, precision)
+    load_time = time.perf_counter() - start
+    rss_loaded = _rss_mb()
+
+    outputs, timings = [], []
+    with torch.no_grad():
+        for x in inputs:
+            tensor = torch.from_numpy(x).unsqueeze(0).to(device, input_dtype(model))
+            model(tensor)  # warm up
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                out = model(tensor)
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+                timings.append(time.perf_counter() - t0)
+            outputs.append(out.view(-1, 3).float().cpu().numpy())
+    return {
+        "precision": precision,
+        "device": str(device),
+        "load_time_s": load_time,
+        "model_rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "latency_p50_s": float(np.median(timings)),
+        "outputs": outputs,
+    }
+
+def bench_precision(args):
+    # A reference cloud is only meaningful next to the RGB-D input it was predicted from
+    if args.reference and len(args.reference) != len(args.inputs or []):
+        raise SystemExit("--reference needs one cloud per --inputs tensor, in the same order")
+    inputs = _load_inputs(args.inputs, args.count)
+    references = [np.loadtxt(path)[:, :3] for path in args.reference]
+    # Each precision loads in a fresh process so RSS is comparable
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    for precision in args.precision:
+        with ctx.Pool(1) as pool:
+            runs[precision] = pool.apply(_run_precision, (args.model, precision, inputs, args.repeat))
+
+    outputs = {precision: run.pop("outputs") for precision, run in runs.items()}
+    results = []
+    for precision, run in runs.items():
+        if "fp32" in outputs:
+            run["chamfer_vs_fp32"] = float(np.mean([
+                chamfer_distance(out, ref) for out, ref in zip(outputs[precision], outputs["fp32"])
+            ]))
+        if references:
+            run["chamfer_vs_reference"] = float(np.mean([
+                chamfer_distance(out, ref) for out, ref in zip(outputs[precision], references)
+            ]))
+        results.append(run)
+    return results
+
+def _run_runtime(runtime, model_path, threads, inputs, batch_sizes, repeat):
+    from runtime import load_runtime
+
+    start = time.perf_counter()
+    loaded = load_runtime(runtime, model_path, "cpu", intra_op_threads=threads)
+    load_time = time.perf_counter() - start
+    results = []
+    for batch_size in batch_sizes:
+        batch = np.resize(inputs, (batch_size, *inputs.shape[1:]))
+        loaded.predict(batch)  # warm up
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            loaded.predict(batch)
+            timings.append(time.perf_counter() - t0)
+        results.append({
+            "runtime": runtime,
+            "intra_op_threads": threads,
+            "batch_size": batch_size,
+            "load_time_s": load_time,
+            "latency_p50_s": float(np.median(timings)),
+            "throughput_ips": batch_size / float(np.median(timings)),
+        })
+    return results
+
+def bench_runtime(args):
+    inputs = _load_inputs(args.inputs, args.count)
+    # Thread settings are process-wide, so every configuration gets a fresh process
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for runtime in args.runtime:
+        for threads in args.threads:
+            with ctx.Pool(1) as pool:
+                results.extend(pool.apply(_run_runtime, (
+                    runtime, args.model.get(runtime), threads, inputs, args.batch_size, args.repeat,
+                )))
+    return results
+
+async def _drive_batcher(batcher, inputs, concurrency, requests):
+    latencies = []
+
+    async def client(worker):
+        for i in range(worker, requests, concurrency):
+            t0 = time.perf_counter()
+            await batcher.submit(inputs[i % len(inputs)])
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(w) for w in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+def bench_batching(args):
+    from batcher import MicroBatcher
+    from model import load_model
+    from precision import input_dtype
+
+    device = torch.device("cuda" if torch.cuda.is_available() and args.precision != "int8" else "cpu")
+    model = load_model(args.model, device, args.precision)
+    inputs = _load_inputs(args.inputs, args.count)
+
+    def run_batch(batch):
+        with torch.no_grad():
+            out = model(torch.from_numpy(batch).to(device, input_dtype(model)))
+        return out.view(batch.shape[0], -1, 3).float().cpu().numpy()
+
+    run_batch(inputs[:1])  # warm up
+    results = []
+    for max_batch_size in args.max_batch_size:
+        batcher = MicroBatcher(run_batch, max_batch_size, args.max_delay_ms)
+
+        async def run():
+            try:
+                return await _drive_batcher(batcher, inputs, args.concurrency, args.requests)
+            finally:
+                await batcher.stop()
+
+        elapsed, latencies = asyncio.run(run())
+        stats = batcher.stats()
+        results.append({
+            "max_batch_size": max_batch_size,
+            "max_delay_ms": args.max_delay_ms,
+            "concurrency": args.concurrency,
+            "device": str(device),
+            "throughput_rps": args.requests / elapsed,
+            "latency_p50_s": float(np.percentile(latencies, 50)),
+            "latency_p99_s": float(np.percentile(latencies, 99)),
+            "mean_batch_size": stats["mean_batch_size"],
+            "queue_wait_p50_ms": stats["queue_wait"]["p50_ms"],
+            "compute_mean_ms": stats["compute"]["mean_ms"],
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=None, help="Append results as JSON lines to this file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    precision = sub.add_parser("precision", help="Latency, RSS and Chamfer distance per serving precision")
+    precision.add_argument("--model", default="model.pt")
+    precision.add_argument("--precision", nargs="+", default=["fp32", "fp16", "int8"])
+    precision.add_argument("--inputs", nargs="*", default=None, help=".npy RGB-D tensors (4, 128, 128); default random")
+    precision.add_argument("--count", type=int, default=4)
+    precision.add_argument("--repeat", type=int, default=5)
+    precision.add_argument("--reference", nargs="*", default=[], help=".xyz clouds expected for --inputs, one per tensor")
+    precision.set_defaults(func=bench_precision)
+
+    runtime = sub.add_parser("runtime", help="CPU latency of the eager, TorchScript and ONNX Runtime models")
+    runtime.add_argument("--runtime", nargs="+", default=["eager", "torchscript", "onnx"])
+    runtime.add_argument("--model", nargs="*", default=[], metavar="RUNTIME=PATH",
+                         help="Artifact per runtime, defaults to runtime.ARTIFACTS")
+    runtime.add_argument("--threads", type=int, nargs="+", default=[0], help="Intra-op threads, 0 for the default")
+    runtime.add_argument("--batch-size", type=int, nargs="+", default=[1, 8])
+    runtime.add_argument("--inputs", nargs="*", default=None, help=".npy RGB-D tensors (4, 128, 128); default random")
+    runtime.add_argument("--count", type=int, default=1)
+    runtime.add_argument("--repeat", type=int, default=5)
+    runtime.set_defaults(func=bench_runtime)
+
+    batching = sub.add_parser("batching", help="Throughput and latency of the micro-batcher under concurrent load")
+    batching.add_argument("--model", default="model.pt")
+    batching.add_argument("--precision", default="fp32")
+    batching.add_argument("--inputs", nargs="*", default=None, help=".npy RGB-D tensors (4, 128, 128); default random")
+    batching.add_argument("--count", type=int, default=8)
+    batching.add_argument("--concurrency", type=int, default=16)
+    batching.add_argument("--requests", type=int, default=128)
+    batching.add_argument("--max-batch-size", type=int, nargs="+", default=[1, 4, 8, 16])
+    batching.add_argument("--max-delay-ms", type=float, default=5)
+    batching.set_defaults(func=bench_batching)
+
+    args = parser.parse_args()
+    if args.command == "runtime":
+        args.model = dict(item.split("=", 1) for item in args.model)
+    results = args.func(args)
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({"benchmark": args.command, **result}) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import resource
+import time
+
+import torch
+
+def load_checkpoint(path):
+    """
+    Memory-map a checkpoint instead of reading it into RAM.
+
+    Tensors are views over the file's pages, paged in on first touch and backed by the page
+    cache, so replicas on the same host that map the same file share one physical copy.
+    """
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+def load_weights(model, state_dict, device):
+    """
+    Load `state_dict` into `model` without a second host copy. On CPU the mapped tensors are
+    assigned in place of the parameters; on GPU each one is copied straight from the mapping.
+    """
+    if torch.device(device).type == "cpu":
+        return model.load_state_dict(state_dict, assign=True)
+    return model.load_state_dict(state_dict)
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class ReadyTimer:
+    """
+    Logs time-to-ready and peak RSS of a service startup.
+    """
+    def __init__(self, service):
+        self.service = service
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.time_to_ready = time.perf_counter() - self.start
+            print(f"[INFO] {self.service} ready in {self.time_to_ready:.2f}s, peak RSS {peak_rss_mb():.0f} MB")
+        return False
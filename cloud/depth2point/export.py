@@ -0,0 +1,112 @@
+"""
+Offline conversions of the Depth2Point checkpoint.
+
+Usage:
+    python export.py fold --input model_full.pt --output model.pt --verify
+    python export.py torchscript --input model.pt --output model_ts.pt --verify
+    python export.py onnx --input model.pt --output model.onnx --verify
+"""
+import argparse
+
+import torch
+
+from model import Depth2Point, load_model
+
+def fold(args):
+    checkpoint = torch.load(args.input, map_location="cpu")
+    compact = Depth2Point(initial_point=0, compact_fc1=True).eval()
+    if checkpoint["fc1.0.weight"].shape[1] == compact.fc1[0].in_features:
+        print("[INFO] Checkpoint is already compact.")
+        folded = checkpoint
+    else:
+        folded = compact.fold_fc1_state_dict(checkpoint)
+    compact.load_state_dict(folded)
+
+    if args.verify:
+        # Needs the full fc1 in memory (~2.7GB) once, offline
+        full = Depth2Point(initial_point=0).eval()
+        full.load_state_dict(checkpoint)
+        verify(full, compact, args.batch_size, args.atol)
+        del full
+
+    torch.save(compact.state_dict(), args.output)
+    before = sum(t.numel() for t in checkpoint.values())
+    after = sum(t.numel() for t in folded.values())
+    print(f"[INFO] Saved {args.output}: {before:,} -> {after:,} parameters")
+
+def torchscript(args):
+    model = load_model(args.input, "cpu")
+    example = torch.rand(1, 4, 128, 128)
+    with torch.no_grad():
+        # Freezing inlines the weights as constants so the graph can be optimized as a whole
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    traced.save(args.output)
+    print(f"[INFO] Saved TorchScript graph to {args.output}")
+
+    if args.verify:
+        from runtime import TorchScriptRuntime
+        verify(model, _as_module(TorchScriptRuntime(args.output, "cpu")), args.batch_size, args.atol)
+
+def onnx(args):
+    model = load_model(args.input, "cpu")
+    example = torch.rand(1, 4, 128, 128)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (example,), args.output,
+            input_names=["rgbd"], output_names=["points"],
+            dynamic_axes={"rgbd": {0: "batch"}, "points": {0: "batch"}},
+            opset_version=args.opset, dynamo=False,
+        )
+    print(f"[INFO] Saved ONNX graph to {args.output}")
+
+    if args.verify:
+        from runtime import OnnxRuntime
+        verify(model, _as_module(OnnxRuntime(args.output, "cpu")), args.batch_size, args.atol)
+
+def _as_module(runtime):
+    """
+    Adapt a runtime's numpy `predict` to the eager model's tensor-in, flat-tensor-out call.
+    """
+    def forward(inputs):
+        return torch.from_numpy(runtime.predict(inputs.numpy())).view(inputs.shape[0], -1)
+    return forward
+
+def verify(reference, candidate, batch_size=4, atol=1e-4):
+    torch.manual_seed(0)
+    inputs = torch.rand(batch_size, 4, 128, 128)
+    with torch.no_grad():
+        expected = reference(inputs)
+        actual = candidate(inputs)
+    max_error = (expected - actual).abs().max().item()
+    print(f"[INFO] Max abs difference: {max_error:.3e} (output range {expected.abs().max().item():.3e})")
+    if not torch.allclose(expected, actual, atol=atol, rtol=1e-4):
+        raise SystemExit(f"[ERROR] Outputs differ by more than atol={atol}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fold_parser = sub.add_parser("fold", help="Fold fc1 over the constant initial point cloud")
+    fold_parser.add_argument("--input", required=True)
+    fold_parser.add_argument("--output", required=True)
+    fold_parser.add_argument("--verify", action="store_true", help="Compare against the original model")
+    fold_parser.add_argument("--batch-size", type=int, default=4)
+    fold_parser.add_argument("--atol", type=float, default=1e-4)
+    fold_parser.set_defaults(func=fold)
+
+    for name, func, default in (("torchscript", torchscript, "model_ts.pt"), ("onnx", onnx, "model.onnx")):
+        graph_parser = sub.add_parser(name, help=f"Export the compact fp32 model as a {name} graph for CPU serving")
+        graph_parser.add_argument("--input", default="model.pt")
+        graph_parser.add_argument("--output", default=default)
+        graph_parser.add_argument("--verify", action="store_true", help="Check parity with the eager model")
+        graph_parser.add_argument("--batch-size", type=int, default=4)
+        graph_parser.add_argument("--atol", type=float, default=1e-4)
+        if name == "onnx":
+            graph_parser.add_argument("--opset", type=int, default=17)
+        graph_parser.set_defaults(func=func)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
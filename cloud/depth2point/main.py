@@ -1,60 +1,189 @@
+import asyncio
 import traceback
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 import torch
 import numpy as np
 
-from model import Depth2Point
+from checkpoint import ReadyTimer
+from batcher import MicroBatcher
+from runtime import runtime_from_env
+from wire import NPY_CONTENT_TYPE, accepts_npy, decode_array, encode_array, is_npy
 
 app = FastAPI()
 
-model_path = "model.pt"
-model = None
+runtime = None
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# D2P_RUNTIME: eager, torchscript or onnx (see runtime.py); D2P_INTRA_OP_THREADS: threads per operator
+# D2P_PRECISION (eager only): fp32, fp16 (half-precision weights) or int8 (dynamic quantization, CPU only)
+# Concurrent /predict requests are coalesced into one forward pass of up to this many images
+max_batch_size = int(os.getenv("D2P_MAX_BATCH_SIZE", 8))
+max_batch_delay_ms = float(os.getenv("D2P_MAX_BATCH_DELAY_MS", 5))
+# /predict_batch splits its inputs into forward passes of at most this many images
+batch_chunk_size = int(os.getenv("D2P_BATCH_CHUNK", 32))
+# Shape of one RGB-D input (RGB + depth at the model's 128x128 resolution)
+INPUT_SHAPE = (4, 128, 128)
+
+def run_batch(inputs):
+    """
+    Forward a stacked (B, 4, H, W) float32 batch, returning (B, 2048, 3) point clouds.
+    """
+    return runtime.predict(inputs)
+
+batcher = MicroBatcher(run_batch, max_batch_size, max_batch_delay_ms)
+
+# /predict_image: segmentation and depth estimation run here too (needs rembg and a MiDaS artifact)
+preprocess_enabled = os.getenv("D2P_PREPROCESS", "false").lower() == "true"
+preprocessor = None
+# Uploads are decoded and segmented on this many threads; depth and points are batched
+segment_executor = ThreadPoolExecutor(max_workers=int(os.getenv("D2P_SEGMENT_CONCURRENCY", 2)))
+
+def run_image_batch(rgb):
+    """
+    One depth estimator pass and one Depth2Point pass over a (B, 3, H, W) batch of segmented images.
+    """
+    rgbd = np.concatenate((rgb, preprocessor.depth(rgb)), axis=1)
+    return runtime.predict(rgbd)
+
+image_batcher = MicroBatcher(run_image_batch, max_batch_size, max_batch_delay_ms)
 
 @app.on_event("startup")
 def startup_event():
-    global model, device
+    global runtime, preprocessor
     try:
-        model = Depth2Point(initial_point=0).to(device)
         print("[INFO] Initializing model...")
-        checkpoint = torch.load(model_path, map_location=device)
-        model.load_state_dict(checkpoint)
-        print("[INFO] Model loaded successfully.")
-        model.eval()
-        print("[INFO] Model loaded successfully.")
+        with ReadyTimer("depth2point"):
+            runtime = runtime_from_env(device)
+            if preprocess_enabled:
+                from preprocessing import RGBDPreprocessor
+
+                preprocessor = RGBDPreprocessor(device)
+                preprocessor.warmup()
+        print(f"[INFO] Model loaded successfully ({type(runtime).__name__}).")
     except Exception as e:
         print(f"[ERROR] Failed to load model: {e}")
         raise HTTPException(status_code=500, detail="Model loading failed")
     
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batcher.stop()
+    await image_batcher.stop()
+    segment_executor.shutdown(wait=False, cancel_futures=True)
+
 @app.get(os.environ['AIP_HEALTH_ROUTE'], status_code=200)
 def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+def stats():
+    return {"batcher": batcher.stats(), "image_batcher": image_batcher.stats()}
+
 @app.post(os.environ['AIP_PREDICT_ROUTE'])
 async def predict(request: Request):
     try: 
-        body = await request.json()
-        print(f"[INFO] Receiving prediction request... : {body}")
-        
-        # Extract the input data
-        json_data = body.get("body")
-        if not json_data:
-            raise HTTPException(status_code=400, detail="Invalid input data")
-        
-        parsed = json.loads(json_data)
-        np_array = np.array(parsed)
-        input_tensor = torch.tensor(np_array).unsqueeze(0).float().to(device)
+        if is_npy(request.headers.get("content-type")):
+            # Binary path: the body is the (4, H, W) RGB-D tensor as .npy
+            np_array = decode_array(await request.body())
+            print(f"[INFO] Receiving prediction request... : npy {np_array.shape}")
+        else:
+            body = await request.json()
+            print(f"[INFO] Receiving prediction request... : {body}")
+
+            # Extract the input data
+            json_data = body.get("body")
+            if not json_data:
+                raise HTTPException(status_code=400, detail="Invalid input data")
+
+            parsed = json.loads(json_data)
+            np_array = np.array(parsed)
         
-        # Inference
-        with torch.no_grad():
-            predicted_point_cloud = model(input_tensor)
-            predicted_point_cloud = predicted_point_cloud.view(-1, 3).cpu().numpy().tolist()
+        # Rejected here, not in the batch, so a malformed input only fails its own request
+        if np_array.shape != INPUT_SHAPE:
+            raise HTTPException(status_code=400, detail=f"Expected a {INPUT_SHAPE} input, got {np_array.shape}")
+
+        # Inference, batched with concurrent requests
+        predicted_point_cloud = await batcher.submit(np.asarray(np_array, dtype=np.float32))
         
-        return {"point_cloud": predicted_point_cloud}
+        if accepts_npy(request.headers.get("accept")):
+            return Response(content=encode_array(predicted_point_cloud), media_type=NPY_CONTENT_TYPE)
+        return {"point_cloud": predicted_point_cloud.tolist()}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] Prediction failed: {e}")
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail="Prediction failed")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Prediction failed")
+
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    """
+    Predict N point clouds in one call. The body is either an (N, 4, H, W) .npy tensor or
+    JSON `{"instances": [...]}` with N nested (4, H, W) lists; the response is an
+    (N, 2048, 3) .npy array or `{"point_clouds": [...]}`, following the Accept header.
+    """
+    try:
+        if is_npy(request.headers.get("content-type")):
+            inputs = decode_array(await request.body())
+        else:
+            body = await request.json()
+            instances = body.get("instances")
+            if not instances:
+                raise HTTPException(status_code=400, detail="Invalid input data")
+            inputs = np.array(instances)
+        inputs = np.asarray(inputs, dtype=np.float32)
+        if inputs.ndim != 4 or inputs.shape[1:] != INPUT_SHAPE:
+            raise HTTPException(status_code=400, detail=f"Expected (N, {', '.join(map(str, INPUT_SHAPE))}) inputs, got {inputs.shape}")
+        print(f"[INFO] Receiving batch prediction request... : {inputs.shape}")
+
+        # Device-sized chunks, run on the same worker as coalesced /predict traffic
+        chunks = [
+            await batcher.run(inputs[start:start + batch_chunk_size])
+            for start in range(0, len(inputs), batch_chunk_size)
+        ]
+        point_clouds = np.concatenate(chunks)
+
+        if accepts_npy(request.headers.get("accept")):
+            return Response(content=encode_array(point_clouds), media_type=NPY_CONTENT_TYPE)
+        return {"point_clouds": point_clouds.tolist()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Batch prediction failed: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Batch prediction failed")
+
+@app.post("/predict_image")
+async def predict_image(request: Request):
+    """
+    Predict a point cloud from an encoded PNG/JPEG body. Concurrent uploads share one batched
+    depth estimation and model pass. The response follows the Accept header like /predict;
+    the .npy response carries the preprocessing info in the X-Preprocessing header.
+    """
+    if preprocessor is None:
+        raise HTTPException(status_code=404, detail="Image preprocessing is disabled (D2P_PREPROCESS=false)")
+    try:
+        image_bytes = await request.body()
+        if not image_bytes:
+            raise HTTPException(status_code=400, detail="Empty image")
+        print(f"[INFO] Receiving image prediction request... : {len(image_bytes)} bytes")
+
+        loop = asyncio.get_running_loop()
+        rgb, info = await loop.run_in_executor(segment_executor, preprocessor.segment, image_bytes)
+        predicted_point_cloud = await image_batcher.submit(rgb)
+
+        if accepts_npy(request.headers.get("accept")):
+            return Response(
+                content=encode_array(predicted_point_cloud),
+                media_type=NPY_CONTENT_TYPE,
+                headers={"X-Preprocessing": json.dumps(info)},
+            )
+        return {"point_cloud": predicted_point_cloud.tolist(), "preprocessing": info}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Image prediction failed: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Image prediction failed")
@@ -2,8 +2,10 @@ import torch
 from torch import nn
 
 class Depth2Point(nn.Module):
-    def __init__(self, initial_point=0):
+    def __init__(self, initial_point=0, compact_fc1=False):
         super(Depth2Point, self).__init__()
+        # compact_fc1: fc1 is stored folded over the constant initial_point (see fold_fc1_state_dict)
+        self.compact_fc1 = compact_fc1
         self.layer1 = self.conv_module(4, 32) # input: rgbd image
         self.layer2 = self.conv_module(32, 64)
         self.layer3 = self.conv_module(64, 128)
@@ -11,7 +13,10 @@ class Depth2Point(nn.Module):
         self.layer5 = self.conv_module(256, 256)
         self.layer6 = self.conv_module(256, 256)
         self.layer7 = self.conv_module(256, 256)
-        self.fc1 = self.fc_module(256 * (3 + 256), 2048 * 5)
+        if compact_fc1:
+            self.fc1 = self.fc_module(256, 2048 * 5)
+        else:
+            self.fc1 = self.fc_module(256 * (3 + 256), 2048 * 5)
         self.fc2 = self.fc_module(2048 * 5, 2048 * 5)
         self.fc3 = self.fc_module(2048 * 5, 2048 * 4)
         self.fc4 = nn.Linear(2048 * 4, 2048 * 3)
@@ -31,6 +36,12 @@ class Depth2Point(nn.Module):
         fv = self.layer7(encoder_out)
         batch_size = fv.shape[0]
 
+        if self.compact_fc1:
+            generator_out = self.fc1(fv.view(batch_size, -1))
+            generator_out = self.fc2(generator_out)
+            generator_out = self.fc3(generator_out)
+            return self.fc4(generator_out)
+
         initial_pc_fv = torch.cat((
             self.initial_point.to(fv.device).view(1, 256, 3).repeat(batch_size, 1, 1),  # torch.Size([batch, 256, 3])
             fv.view(batch_size, 1, 256).repeat(1, 256, 1)  # torch.Size([batch, 256, 256])
@@ -43,6 +54,35 @@ class Depth2Point(nn.Module):
 
         return generator_out
 
+    def fold_fc1_state_dict(self, state_dict, chunk_size=512):
+        """
+        Convert a checkpoint with the original fc1 into the compact form used with compact_fc1=True.
+
+        fc1 sees [initial_point_i, fv] for each of the 256 sphere points, flattened, so
+        W @ x + b = (b + sum_i W_i[:, :3] @ p_i) + (sum_i W_i[:, 3:]) @ fv: a constant bias plus a
+        256 -> 10240 projection. Folding runs over output rows in float64 to bound memory and
+        rounding error.
+        """
+        weight = state_dict["fc1.0.weight"]
+        bias = state_dict["fc1.0.bias"]
+        points = self.initial_point.to(torch.float64)
+        num_points, coords = points.shape
+        out_features = weight.shape[0]
+        in_per_point = weight.shape[1] // num_points
+
+        folded_weight = torch.empty(out_features, in_per_point - coords, dtype=weight.dtype)
+        folded_bias = torch.empty(out_features, dtype=bias.dtype)
+        for start in range(0, out_features, chunk_size):
+            rows = weight[start:start + chunk_size].to(torch.float64).view(-1, num_points, in_per_point)
+            folded_weight[start:start + chunk_size] = rows[:, :, coords:].sum(dim=1).to(weight.dtype)
+            constant = torch.einsum("oic,ic->o", rows[:, :, :coords], points)
+            folded_bias[start:start + chunk_size] = (bias[start:start + chunk_size].to(torch.float64) + constant).to(bias.dtype)
+
+        folded = dict(state_dict)
+        folded["fc1.0.weight"] = folded_weight
+        folded["fc1.0.bias"] = folded_bias
+        return folded
+
     def conv_module(self, in_num, out_num):
         return nn.Sequential(
             nn.Conv2d(in_num, out_num, kernel_size=3, stride=2, padding=1),
@@ -56,8 +96,8 @@ class Depth2Point(nn.Module):
         )
 
     def sphere(self, offset=(0, 0, 0)):
-        u = torch.linspace(0, 2 * torch.pi, 16)
-        v = torch.linspace(0, torch.pi, 16)
+        u = torch.linspace(0, 2 * torch.pi, 16, device="cpu")
+        v = torch.linspace(0, torch.pi, 16, device="cpu")
         x = torch.flatten(1 * torch.outer(torch.cos(u), torch.sin(v)))
         y = torch.flatten(1 * torch.outer(torch.sin(u), torch.sin(v)))
         z = torch.flatten(1 * torch.outer(torch.ones(torch.Tensor.size(u)), torch.cos(v)))
@@ -65,7 +105,7 @@ class Depth2Point(nn.Module):
 
     def fibonacci_sphere(self, num_pts=256, offset=(0, 0, 0), radius=1):
         # https://stackoverflow.com/questions/9600801/evenly-distributing-n-points-on-a-sphere
-        indices = torch.arange(0, num_pts, dtype=torch.float32) + 0.5
+        indices = torch.arange(0, num_pts, dtype=torch.float32, device="cpu") + 0.5
         phi = torch.arccos(1 - 2*indices/num_pts)
         theta = torch.pi * (1 + 5**0.5) * indices
         x, y, z = torch.cos(theta) * torch.sin(phi), torch.sin(theta) * torch.sin(phi), torch.cos(phi)
@@ -74,4 +114,28 @@ class Depth2Point(nn.Module):
     def multiple_sphere(self):
         sphere_1 = self.fibonacci_sphere(128, (0, -0.8, 0.3), 0.3)
         sphere_2 = self.fibonacci_sphere(128, (0, 0.4, -0.2), 0.3)
-        return torch.cat((sphere_1, sphere_2), 0)
\ No newline at end of file
+        return torch.cat((sphere_1, sphere_2), 0)
+
+def load_model(model_path, device, precision="fp32"):
+    """
+    Build the inference model from a checkpoint: compact fc1 (folding original checkpoints on
+    the fly), moved to `device`, in eval mode and converted to the serving precision.
+    """
+    from checkpoint import load_checkpoint
+    from precision import apply_precision
+
+    # Parameters start on the meta device: the checkpoint tensors are assigned in, never copied
+    # over a randomly initialized model
+    with torch.device("meta"):
+        model = Depth2Point(initial_point=0, compact_fc1=True)
+    checkpoint = load_checkpoint(model_path)
+    if checkpoint["fc1.0.weight"].shape[1] != model.fc1[0].in_features:
+        # Original checkpoint: fold fc1 at load time (export.py fold does this ahead of time).
+        # Only one chunk of the mapped fc1 weight is resident at a time.
+        print("[INFO] Folding fc1 into its compact form...")
+        checkpoint = model.fold_fc1_state_dict(checkpoint)
+    model.load_state_dict(checkpoint, assign=True)
+    del checkpoint
+    model.to(device)
+    model.eval()
+    return apply_precision(model, precision, device)
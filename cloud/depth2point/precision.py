@@ -0,0 +1,67 @@
+import torch
+from torch import nn
+import torch.nn.functional as F
+
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# Output rows upcast at a time by HalfStorageLinear; bounds the transient fp32 weight copy
+UPCAST_CHUNK_ROWS = 1024
+
+class HalfStorageLinear(nn.Module):
+    """
+    Linear layer whose weights are stored in fp16 and upcast to the input dtype per call,
+    `chunk_rows` output rows at a time. Halves weight memory on CPU, where fp16 matmuls are
+    slow or unsupported; the upcast adds at most `chunk_rows` x in_features fp32 values at peak.
+    """
+    def __init__(self, linear, chunk_rows=UPCAST_CHUNK_ROWS):
+        super(HalfStorageLinear, self).__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        self.chunk_rows = chunk_rows
+        self.weight = nn.Parameter(linear.weight.detach().half(), requires_grad=False)
+        self.bias = None if linear.bias is None else nn.Parameter(linear.bias.detach().half(), requires_grad=False)
+
+    def forward(self, x):
+        out = x.new_empty(*x.shape[:-1], self.out_features)
+        for start in range(0, self.out_features, self.chunk_rows):
+            stop = min(start + self.chunk_rows, self.out_features)
+            bias = None if self.bias is None else self.bias[start:stop].to(x.dtype)
+            out[..., start:stop] = F.linear(x, self.weight[start:stop].to(x.dtype), bias)
+        return out
+
+def _replace_linears(module, factory):
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear):
+            setattr(module, name, factory(child))
+        else:
+            _replace_linears(child, factory)
+    return module
+
+def apply_precision(model, precision, device):
+    """
+    Convert an fp32 model in eval mode to a serving precision.
+
+    fp32: unchanged.
+    fp16: on CUDA the whole model runs in half precision; on CPU the Linear stack stores fp16
+          weights and computes in fp32.
+    int8: dynamic int8 quantization of the Linear stack (weights int8, activations quantized
+          per batch). CPU only.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    device = torch.device(device)
+    if precision == "fp16":
+        if device.type == "cuda":
+            return model.half()
+        return _replace_linears(model, HalfStorageLinear)
+    if precision == "int8":
+        if device.type != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    return model
+
+def input_dtype(model):
+    """
+    dtype the model expects its input in (the conv encoder is never quantized).
+    """
+    return next(model.parameters()).dtype
@@ -0,0 +1,174 @@
+"""
+Image -> RGB-D preprocessing for /predict_image, mirroring backend/utils/preprocessing.py so
+the gateway can ship encoded images instead of float tensors.
+
+Usage (build time, resolves MiDaS through torch.hub once):
+    python preprocessing.py export --model-type DPT_Hybrid
+"""
+import io
+import math
+import os
+
+import numpy as np
+import torch
+from PIL import Image
+from scipy import ndimage
+
+MIDAS_HUB_REPO = "intel-isl/MiDaS"
+MIDAS_MODEL_TYPES = ("DPT_Large", "DPT_Hybrid", "MiDaS", "MiDaS_small")
+MIDAS_MODEL_DIR = os.getenv("MIDAS_MODEL_DIR", "./models/midas")
+MIDAS_ALLOW_HUB = os.getenv("MIDAS_ALLOW_HUB", "false").lower() == "true"
+# Any of MIDAS_MODEL_TYPES, or "silhouette" for the CPU fallback without a network
+DEPTH_BACKEND = os.getenv("D2P_DEPTH_BACKEND", "DPT_Hybrid")
+
+REMBG_MAX_SIDE = int(os.getenv("REMBG_MAX_SIDE", 1024))
+ALPHA_MIN_COVERAGE = float(os.getenv("ALPHA_MIN_COVERAGE", 0.01))
+ALPHA_MAX_COVERAGE = float(os.getenv("ALPHA_MAX_COVERAGE", 0.99))
+ALPHA_MAX_SOFT_FRACTION = float(os.getenv("ALPHA_MAX_SOFT_FRACTION", 0.05))
+
+def midas_artifact_path(model_type, resize=(128, 128), model_dir=None):
+    return os.path.join(model_dir or MIDAS_MODEL_DIR, f"{model_type}_{resize[0]}x{resize[1]}.pt")
+
+def export_midas(model_type, resize=(128, 128), model_dir=None, device="cpu"):
+    """
+    Save a traced MiDaS for a fixed input size to the local registry (same layout as the backend's).
+    """
+    model = torch.hub.load(MIDAS_HUB_REPO, model_type).to(device).eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.rand(1, 3, *resize, device=device))
+    path = midas_artifact_path(model_type, resize, model_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    traced.save(path)
+    print(f"[INFO] Exported {model_type} to {path}")
+    return path
+
+def load_midas(model_type, device, resize=(128, 128), model_dir=None, allow_hub=None):
+    if model_type not in MIDAS_MODEL_TYPES:
+        raise ValueError(f"Unsupported MiDaS model type: {model_type}")
+    allow_hub = MIDAS_ALLOW_HUB if allow_hub is None else allow_hub
+    path = midas_artifact_path(model_type, resize, model_dir)
+    if os.path.isfile(path):
+        model = torch.jit.load(path, map_location=device)
+    elif allow_hub:
+        print(f"[INFO] No local artifact for {model_type}, resolving through torch.hub")
+        model = torch.hub.load(MIDAS_HUB_REPO, model_type).to(device)
+    else:
+        raise FileNotFoundError(f"No local MiDaS artifact at {path}. Run `python preprocessing.py export` or set MIDAS_ALLOW_HUB=true.")
+    return model.eval()
+
+def decode_image(image_bytes, working_side=None):
+    """
+    Open an encoded upload, letting the JPEG decoder downscale to about `working_side`.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if working_side and image.format == "JPEG" and max(image.size) > working_side:
+        w, h = image.size
+        ratio = working_side / max(w, h)
+        image.draft(None, (math.ceil(w * ratio), math.ceil(h * ratio)))
+    return image
+
+def usable_alpha(image):
+    """
+    The alpha channel of `image` if it looks like a clean foreground mask, else None.
+    """
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode not in ("RGBA", "LA", "PA"):
+        return None
+    alpha = image.getchannel("A")
+    histogram = alpha.histogram()
+    total = sum(histogram)
+    coverage = sum(histogram[128:]) / total
+    soft = sum(histogram[16:240]) / total
+    if ALPHA_MIN_COVERAGE <= coverage <= ALPHA_MAX_COVERAGE and soft <= ALPHA_MAX_SOFT_FRACTION:
+        return alpha
+    return None
+
+def segmentation_mask(image, session, max_side=None):
+    from rembg import remove
+
+    if not max_side or max(image.size) <= max_side:
+        return remove(image, session=session, only_mask=True)
+    small = image.copy()
+    small.thumbnail((max_side, max_side), Image.BILINEAR)
+    return remove(small, session=session, only_mask=True).resize(image.size, Image.BILINEAR)
+
+class RGBDPreprocessor:
+    """
+    Builds the (4, H, W) Depth2Point input from encoded images.
+
+    `segment` handles one upload (decode, alpha or rembg mask, resize) and is safe to run on
+    several threads; `depth` runs the depth estimator once over a stacked batch of segmented
+    images, so it belongs on the model's batching thread.
+    """
+    def __init__(self, device, depth_backend=DEPTH_BACKEND, resize=(128, 128), rembg_model="u2net",
+                 segmentation_max_side=REMBG_MAX_SIDE):
+        from rembg import new_session
+
+        self.device = torch.device(device)
+        self.depth_backend = depth_backend
+        self.resize = resize
+        self.segmentation_max_side = segmentation_max_side
+        self.working_side = max(segmentation_max_side, *resize) if segmentation_max_side else None
+        self.midas = None if depth_backend == "silhouette" else load_midas(depth_backend, self.device, resize)
+        self.rembg_session = new_session(rembg_model)
+
+    def segment(self, image_bytes):
+        """
+        Returns:
+            tuple: ((3, H, W) float32 RGB in [0, 1] with the background zeroed, info dict)
+        """
+        image = decode_image(image_bytes, self.working_side)
+        decoded_size = image.size
+        alpha = usable_alpha(image)
+        if alpha is not None:
+            segmentation = "alpha"
+            mask = alpha
+        else:
+            max_side = self.segmentation_max_side
+            segmentation = "rembg_capped" if max_side and max(image.size) > max_side else "rembg"
+            mask = segmentation_mask(image.convert("RGB"), self.rembg_session, max_side)
+        image = Image.composite(image.convert("RGB"), Image.new("RGB", image.size, 0), mask)
+        resized = image.resize((self.resize[1], self.resize[0]), Image.BILINEAR)
+        rgb = np.asarray(resized, dtype=np.float32).transpose(2, 0, 1) / 255
+        return rgb, {"segmentation": segmentation, "depth_backend": self.depth_backend, "decoded_size": decoded_size}
+
+    def depth(self, rgb):
+        """
+        Args:
+            rgb (np.ndarray): (B, 3, H, W) segmented images from `segment`.
+
+        Returns:
+            np.ndarray: (B, 1, H, W) depth, min-max normalized per image and quantized to 8 bits
+                like the backend's depth map.
+        """
+        if self.midas is None:
+            masks = rgb.max(axis=1) > 0
+            depth = np.stack([np.sqrt(ndimage.distance_transform_edt(m)) for m in masks]).astype(np.float32)
+        else:
+            with torch.no_grad():
+                depth = self.midas(torch.from_numpy(rgb).to(self.device)).cpu().numpy().reshape(len(rgb), *self.resize)
+        low = depth.min(axis=(1, 2), keepdims=True)
+        span = depth.max(axis=(1, 2), keepdims=True) - low
+        normalized = np.divide(depth - low, span, out=np.zeros_like(depth), where=span > 0)
+        return ((normalized * 255).astype(np.uint8).astype(np.float32) / 255)[:, None]
+
+    def warmup(self):
+        dummy = Image.new("RGB", (self.resize[1] * 2, self.resize[0] * 2), (127, 127, 127))
+        buffer = io.BytesIO()
+        dummy.save(buffer, format="PNG")
+        rgb, _ = self.segment(buffer.getvalue())
+        self.depth(rgb[None])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model-type", default=DEPTH_BACKEND, choices=MIDAS_MODEL_TYPES)
+    parser.add_argument("--size", type=int, nargs=2, default=(128, 128), metavar=("H", "W"))
+    parser.add_argument("--model-dir", default=None)
+    args = parser.parse_args()
+
+    export_midas(args.model_type, tuple(args.size), args.model_dir)
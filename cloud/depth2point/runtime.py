@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import torch
+
+RUNTIMES = ("eager", "torchscript", "onnx")
+# Default artifact per runtime, as written by `python export.py torchscript|onnx`
+ARTIFACTS = {"eager": "model.pt", "torchscript": "model_ts.pt", "onnx": "model.onnx"}
+
+class EagerRuntime:
+    """
+    The Depth2Point nn.Module, in any serving precision.
+    """
+    def __init__(self, model_path, device, precision="fp32"):
+        from model import load_model
+        from precision import input_dtype
+
+        self.device = torch.device(device)
+        self.model = load_model(model_path, self.device, precision)
+        self.dtype = input_dtype(self.model)
+
+    def predict(self, inputs):
+        with torch.no_grad():
+            out = self.model(torch.from_numpy(inputs).to(self.device, self.dtype))
+        return out.view(inputs.shape[0], -1, 3).float().cpu().numpy()
+
+class TorchScriptRuntime:
+    """
+    A frozen, traced Depth2Point graph loaded without the Python model definition.
+    """
+    def __init__(self, model_path, device):
+        self.device = torch.device(device)
+        self.model = torch.jit.load(model_path, map_location=self.device)
+        self.model.eval()
+
+    def predict(self, inputs):
+        with torch.no_grad():
+            out = self.model(torch.from_numpy(inputs).to(self.device))
+        return out.view(inputs.shape[0], -1, 3).float().cpu().numpy()
+
+class OnnxRuntime:
+    """
+    Depth2Point exported to ONNX, run by ONNX Runtime with full graph optimizations.
+    """
+    def __init__(self, model_path, device, intra_op_threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        # Batches run one at a time (see batcher.py); parallelism is within each operator
+        options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        if torch.device(device).type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(model_path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, inputs):
+        out = self.session.run(None, {self.input_name: np.ascontiguousarray(inputs, dtype=np.float32)})[0]
+        return out.reshape(inputs.shape[0], -1, 3)
+
+def load_runtime(runtime="eager", model_path=None, device="cpu", precision="fp32", intra_op_threads=0):
+    """
+    Load Depth2Point for serving.
+
+    Args:
+        runtime (str): One of RUNTIMES. torchscript and onnx load artifacts written by export.py.
+        model_path (str): Checkpoint or artifact path, defaults to ARTIFACTS[runtime].
+        precision (str): Serving precision, eager only; exported graphs are fp32.
+        intra_op_threads (int): Threads per operator; 0 keeps the runtime default (all cores).
+
+    Returns:
+        A runtime whose `predict` maps a (B, 4, H, W) float32 array to (B, 2048, 3) points.
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{runtime}', expected one of {RUNTIMES}")
+    model_path = model_path or ARTIFACTS[runtime]
+    if intra_op_threads and runtime != "onnx":
+        torch.set_num_threads(intra_op_threads)
+    if runtime == "eager":
+        return EagerRuntime(model_path, device, precision)
+    if precision != "fp32":
+        print(f"[WARN] D2P_PRECISION={precision} is ignored by the {runtime} runtime")
+    if runtime == "torchscript":
+        return TorchScriptRuntime(model_path, device)
+    return OnnxRuntime(model_path, device, intra_op_threads)
+
+def runtime_from_env(device):
+    return load_runtime(
+        os.getenv("D2P_RUNTIME", "eager"),
+        os.getenv("D2P_MODEL_PATH") or None,
+        device,
+        os.getenv("D2P_PRECISION", "fp32"),
+        int(os.getenv("D2P_INTRA_OP_THREADS", 0)),
+    )
@@ -0,0 +1,382 @@
+"""
+Benchmarks for the SAPCU upsampling service.
+
+Usage:
+    python benchmark.py seeds --input ../../backend/data/predicted_cloud.xyz --dense ./dense
+    python benchmark.py rotation --patches 400 --repeat 20
+    python benchmark.py fps --sizes 20000 50000 100000 200000 --modes exact voxel torch
+    python benchmark.py index --workers 1 -1
+    python benchmark.py stages --input ../../backend/data/predicted_cloud.xyz
+    python benchmark.py alloc --input ../../backend/data/predicted_cloud.xyz
+    python benchmark.py stress --concurrency 4 --requests 8
+    python benchmark.py stress --url http://localhost:8080/predict --concurrency 4 --requests 8
+
+In-process upsampling (stages, alloc, stress without --url) seeds through SAPCU_SEED_GENERATOR,
+which defaults to the ./dense binary; set SAPCU_SEED_GENERATOR=lattice where it is absent.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from sklearn.neighbors import KDTree
+
+from seeds import SEED_STEP, SEED_THRESHOLD, generate_seeds, run_dense
+
+def normalize(cloud):
+    """
+    Center on the bounding box and scale its longest side to 1, as predict() does.
+    """
+    low, high = cloud.min(axis=0), cloud.max(axis=0)
+    return (cloud - (low + high) / 2) / (high - low).max()
+
+def load_cloud(path, count=2048):
+    if path:
+        return normalize(np.loadtxt(path)[:, :3])
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(count, 3))
+    return normalize(points / np.linalg.norm(points, axis=1, keepdims=True))
+
+def distribution(seeds, points):
+    """
+    Summary of where seeds sit relative to the input surface.
+    """
+    dist, _ = KDTree(points).query(seeds, 1)
+    dist = dist[:, 0]
+    spacing, _ = KDTree(seeds).query(seeds, 2)
+    return {
+        "count": int(len(seeds)),
+        "surface_dist_mean": float(dist.mean()),
+        "surface_dist_p50": float(np.percentile(dist, 50)),
+        "surface_dist_p95": float(np.percentile(dist, 95)),
+        "surface_dist_max": float(dist.max()),
+        "seed_spacing_mean": float(spacing[:, 1].mean()),
+    }
+
+def bench_seeds(args):
+    points = load_cloud(args.input, args.count)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        seeds = generate_seeds(points, args.threshold, args.step)
+        timings.append(time.perf_counter() - start)
+    results = [{"generator": "in_process", "time_p50_s": float(np.median(timings)), **distribution(seeds, points)}]
+
+    if args.dense and os.path.isfile(args.dense):
+        start = time.perf_counter()
+        dense_seeds = run_dense(points, args.threshold, args.dense)
+        elapsed = time.perf_counter() - start
+        result = {"generator": "dense", "time_p50_s": elapsed, **distribution(dense_seeds, points)}
+        # Symmetric mean nearest-neighbour distance between the two seed sets
+        ab, _ = KDTree(dense_seeds).query(seeds, 1)
+        ba, _ = KDTree(seeds).query(dense_seeds, 1)
+        result["chamfer_vs_in_process"] = float(ab.mean() + ba.mean())
+        results.append(result)
+    elif args.dense:
+        print(f"[WARN] {args.dense} not found, skipping the binary comparison")
+    return results
+
+def load_models(weights, device):
+    import fd_config
+    import fn_config
+    from checkpoint import load_checkpoint, load_weights
+
+    torch.manual_seed(0)
+    model_fn = fn_config.get_model(device)
+    model_fd = fd_config.get_model(device)
+    if weights and os.path.isfile(weights):
+        state_dict = load_checkpoint(weights)
+        load_weights(model_fn, state_dict["model1"], device)
+        load_weights(model_fd, state_dict["model2"], device)
+    else:
+        print(f"[WARN] {weights} not found, using randomly initialized models")
+    return model_fn.eval(), model_fd.eval()
+
+def distinct_clouds(path, count, variants):
+    """
+    `variants` different inputs: the base cloud under distinct random rotations and scales.
+    """
+    base = np.loadtxt(path)[:, :3] if path else load_cloud(None, count)
+    rng = np.random.default_rng(0)
+    clouds = []
+    for _ in range(variants):
+        q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        clouds.append(base @ q.T * rng.uniform(0.5, 2.0))
+    return clouds
+
+def bench_rotation(args):
+    """
+    Per-patch rotation of one fd chunk: the former Python loop against the batched version.
+    """
+    from utils import rotate_patches, rotation_matrix_from_vectors
+
+    rng = np.random.default_rng(0)
+    patches = rng.normal(size=(args.patches, args.k, 3)) * 0.05
+    normals = rng.normal(size=(args.patches, 3)).astype(np.float32)
+
+    def loop():
+        out = patches.copy()
+        for j in range(out.shape[0]):
+            M1 = rotation_matrix_from_vectors(normals[j], [1, 0, 0])
+            out[j] = (np.matmul(M1, out[j].T)).T
+        return out
+
+    results = []
+    for name, fn in (("loop", loop), ("batched", lambda: rotate_patches(patches, normals, [1, 0, 0]))):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = fn()
+            timings.append(time.perf_counter() - start)
+        results.append({"impl": name, "patches": args.patches, "k": args.k, "time_p50_ms": float(np.median(timings)) * 1000})
+    results[1]["max_abs_diff_vs_loop"] = float(np.abs(loop() - out).max())
+    return results
+
+def bench_fps(args):
+    """
+    FPS engines on noisy spheres of 20k-200k points. The covering radius (largest distance
+    from any input point to its nearest sample) measures how evenly the sample spreads.
+    """
+    import fps
+
+    fps.warmup()
+    rng = np.random.default_rng(0)
+    results = []
+    for size in args.sizes:
+        points = rng.normal(size=(size, 3))
+        points /= np.linalg.norm(points, axis=1, keepdims=True)
+        points += rng.normal(size=points.shape) * 0.01
+        picked = {}
+        for mode in args.modes:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                picked[mode] = fps.farthest_point_sample(points, args.num_points, mode=mode, seed=args.seed)
+                timings.append(time.perf_counter() - start)
+            covering, _ = KDTree(points[picked[mode]]).query(points, 1)
+            result = {
+                "mode": mode,
+                "input_points": size,
+                "num_points": args.num_points,
+                "time_p50_s": float(np.median(timings)),
+                "covering_radius": float(covering.max()),
+            }
+            if mode != "torch" and "torch" in picked and args.seed is None:
+                result["same_picks_as_torch"] = float(np.mean(picked[mode] == picked["torch"]))
+            results.append(result)
+    return results
+
+def bench_index(args):
+    """
+    The pipeline's neighbour searches with sklearn's KDTree against SpatialIndex: the 100-NN
+    patch gather of every seed on the input, then the 30-NN outlier query on the seed-sized cloud.
+    """
+    from spatial import SpatialIndex
+
+    points = load_cloud(args.input, args.count)
+    seeds = generate_seeds(points)
+    cloud = seeds + np.random.default_rng(0).normal(size=seeds.shape) * 0.005
+
+    def run_sklearn():
+        KDTree(points).query(seeds, 100)
+        KDTree(cloud).query(cloud, 30)
+
+    def run_index(workers):
+        SpatialIndex(points, workers).query(seeds, 100)
+        SpatialIndex(cloud, workers).query(cloud, 30)
+
+    configs = [("sklearn", None, run_sklearn)] + [("spatial_index", w, lambda w=w: run_index(w)) for w in args.workers]
+    results = []
+    for name, workers, fn in configs:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        results.append({
+            "index": name,
+            "workers": workers,
+            "cpus": os.cpu_count(),
+            "seeds": len(seeds),
+            "time_p50_s": float(np.median(timings)),
+        })
+    return results
+
+def bench_stages(args):
+    """
+    Wall time per pipeline stage for one input (2048 points for the default sample cloud).
+    """
+    import fps
+    from pipeline import upsample
+
+    fps.warmup()  # as at service startup
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model_fn, model_fd = load_models(args.weights, device)
+    cloud = np.loadtxt(args.input)[:, :3] if args.input else load_cloud(None, args.count)
+    results = []
+    for _ in range(args.repeat):
+        timings = {}
+        start = time.perf_counter()
+        upsample(cloud, model_fn, model_fd, device, args.num_points, args.seed_step, timings)
+        total = time.perf_counter() - start
+        results.append({"input_points": len(cloud), "total_s": total, **{f"{k}_s": v for k, v in timings.items()}})
+    return results
+
+def bench_alloc(args):
+    """
+    tracemalloc profile of one upsampling request: peak traced memory of the whole request.
+    Covers Python and NumPy allocations, not torch's own allocator.
+    """
+    import tracemalloc
+
+    import fps
+    from pipeline import upsample
+
+    fps.warmup()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model_fn, model_fd = load_models(args.weights, device)
+    cloud = np.loadtxt(args.input)[:, :3] if args.input else load_cloud(None, args.count)
+    upsample(cloud, model_fn, model_fd, device, args.num_points, args.seed_step)  # warm caches
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    upsample(cloud, model_fn, model_fd, device, args.num_points, args.seed_step)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return [{
+        "input_points": len(cloud),
+        "seconds": elapsed,
+        "peak_traced_mb": peak / 2**20,
+        "retained_mb": current / 2**20,
+    }]
+
+def _post_cloud(url, cloud):
+    from wire import NPY_CONTENT_TYPE, decode_array, encode_array
+
+    request = urllib.request.Request(
+        url, data=encode_array(cloud), method="POST",
+        headers={"Content-Type": NPY_CONTENT_TYPE, "Accept": NPY_CONTENT_TYPE},
+    )
+    with urllib.request.urlopen(request) as response:
+        return decode_array(response.read())
+
+def bench_stress(args):
+    """
+    Fire concurrent upsampling requests on distinct inputs and check that every output matches
+    the same input's output from a serial run, i.e. that requests do not leak into each other.
+    """
+    clouds = distinct_clouds(args.input, args.count, args.variants)
+    if args.url:
+        run = lambda cloud: _post_cloud(args.url, cloud)
+    else:
+        from pipeline import upsample
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model_fn, model_fd = load_models(args.weights, device)
+        run = lambda cloud: upsample(cloud, model_fn, model_fd, device, args.num_points, args.seed_step)
+
+    start = time.perf_counter()
+    references = [run(cloud) for cloud in clouds]
+    serial_time = time.perf_counter() - start
+
+    jobs = [i % len(clouds) for i in range(args.requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outputs = list(pool.map(lambda i: run(clouds[i]), jobs))
+    concurrent_time = time.perf_counter() - start
+
+    diffs = [float(np.abs(out - references[i]).max()) for i, out in zip(jobs, outputs)]
+    mismatches = sum(d > args.atol for d in diffs)
+    return [{
+        "mode": "http" if args.url else "in_process",
+        "variants": len(clouds),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "serial_time_per_request_s": serial_time / len(clouds),
+        "concurrent_time_per_request_s": concurrent_time / args.requests,
+        "max_abs_diff": max(diffs),
+        "mismatches": mismatches,
+        "independent": mismatches == 0,
+    }]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=None, help="Append results as JSON lines to this file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seeds = sub.add_parser("seeds", help="Seed generation time and distribution, optionally against ./dense")
+    seeds.add_argument("--input", default=None, help=".xyz input cloud; default a random unit sphere")
+    seeds.add_argument("--count", type=int, default=2048)
+    seeds.add_argument("--threshold", type=float, default=SEED_THRESHOLD)
+    seeds.add_argument("--step", type=float, default=SEED_STEP)
+    seeds.add_argument("--repeat", type=int, default=5)
+    seeds.add_argument("--dense", default=None, help="Path to the legacy dense binary")
+    seeds.set_defaults(func=bench_seeds)
+
+    rotation = sub.add_parser("rotation", help="Microbenchmark of the fd-stage patch rotation")
+    rotation.add_argument("--patches", type=int, default=400)
+    rotation.add_argument("--k", type=int, default=100)
+    rotation.add_argument("--repeat", type=int, default=20)
+    rotation.set_defaults(func=bench_rotation)
+
+    fps_parser = sub.add_parser("fps", help="Time and coverage of the farthest point sampling engines")
+    fps_parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 50000, 100000, 200000])
+    fps_parser.add_argument("--modes", nargs="+", default=["torch", "exact", "voxel"])
+    fps_parser.add_argument("--num-points", type=int, default=8192)
+    fps_parser.add_argument("--seed", type=int, default=None)
+    fps_parser.add_argument("--repeat", type=int, default=1)
+    fps_parser.set_defaults(func=bench_fps)
+
+    index = sub.add_parser("index", help="Neighbour search wall time, sklearn KDTree vs SpatialIndex")
+    index.add_argument("--input", default="../../backend/data/predicted_cloud.xyz")
+    index.add_argument("--count", type=int, default=2048)
+    index.add_argument("--workers", type=int, nargs="+", default=[1, -1])
+    index.add_argument("--repeat", type=int, default=3)
+    index.set_defaults(func=bench_index)
+
+    stages = sub.add_parser("stages", help="Per-stage wall time of one upsampling request")
+    stages.add_argument("--weights", default="./model-store/combined_model.pt")
+    stages.add_argument("--input", default="../../backend/data/predicted_cloud.xyz")
+    stages.add_argument("--count", type=int, default=2048)
+    stages.add_argument("--repeat", type=int, default=1)
+    stages.add_argument("--num-points", type=int, default=8192)
+    stages.add_argument("--seed-step", type=float, default=SEED_STEP)
+    stages.set_defaults(func=bench_stages)
+
+    alloc = sub.add_parser("alloc", help="tracemalloc allocation profile of one upsampling request")
+    alloc.add_argument("--weights", default="./model-store/combined_model.pt")
+    alloc.add_argument("--input", default="../../backend/data/predicted_cloud.xyz")
+    alloc.add_argument("--count", type=int, default=2048)
+    alloc.add_argument("--num-points", type=int, default=8192)
+    alloc.add_argument("--seed-step", type=float, default=SEED_STEP)
+    alloc.set_defaults(func=bench_alloc)
+
+    stress = sub.add_parser("stress", help="Parallel requests on distinct inputs must match their serial outputs")
+    stress.add_argument("--url", default=None, help="Predict URL of a running service; default in-process")
+    stress.add_argument("--weights", default="./model-store/combined_model.pt")
+    stress.add_argument("--input", default="../../backend/data/predicted_cloud.xyz")
+    stress.add_argument("--count", type=int, default=2048)
+    stress.add_argument("--variants", type=int, default=4, help="Distinct input clouds")
+    stress.add_argument("--requests", type=int, default=8)
+    stress.add_argument("--concurrency", type=int, default=4)
+    stress.add_argument("--num-points", type=int, default=8192)
+    stress.add_argument("--seed-step", type=float, default=SEED_STEP, help="In-process only; coarser is faster")
+    stress.add_argument("--atol", type=float, default=1e-5)
+    stress.set_defaults(func=bench_stress)
+
+    args = parser.parse_args()
+    results = args.func(args)
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({"benchmark": args.command, **result}) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+
+import numba
+import numpy as np
+
+# exact: compiled FPS over every point; voxel: FPS over one representative per occupied voxel;
+# torch: the original tensor implementation in utils.py (use on GPU replicas)
+FPS_MODE = os.getenv("SAPCU_FPS_MODE", "exact")
+# Start index seed; unset keeps the historical start at the middle point
+FPS_SEED = int(os.environ["SAPCU_FPS_SEED"]) if os.getenv("SAPCU_FPS_SEED") else None
+# voxel mode keeps about this many candidates per requested sample
+FPS_OVERSAMPLE = float(os.getenv("SAPCU_FPS_OVERSAMPLE", 4))
+
+# Fast-math without nnan/ninf: distances are finite, but no flag lets LLVM assume that
+@numba.jit(nopython=True, fastmath={"nsz", "arcp", "contract", "afn", "reassoc"})
+def _fps_kernel(x, y, z, count, start):
+    n = x.shape[0]
+    nearest = np.full(n, np.finfo(np.float32).max, dtype=np.float32)
+    picked = np.empty(count, dtype=np.int64)
+    farthest = start
+    for i in range(count):
+        picked[i] = farthest
+        cx, cy, cz = x[farthest], y[farthest], z[farthest]
+        best = np.float32(-1.0)
+        best_index = 0
+        # One fused pass: update each point's distance to the sample and track the maximum
+        for j in range(n):
+            dx = x[j] - cx
+            dy = y[j] - cy
+            dz = z[j] - cz
+            d = dx * dx + dy * dy + dz * dz
+            if d < nearest[j]:
+                nearest[j] = d
+            if nearest[j] > best:
+                best = nearest[j]
+                best_index = j
+        farthest = best_index
+    return picked
+
+def start_index(n, seed=None):
+    """
+    Deterministic first sample: the middle point, or a seeded random point.
+    """
+    if seed is None:
+        return n // 2
+    return int(np.random.default_rng(seed).integers(n))
+
+def exact_fps(points, count, seed=None):
+    """
+    Farthest point sampling over all points, as a compiled loop over float32 x/y/z arrays.
+
+    Returns:
+        np.ndarray: (count,) int64 indices into `points`, in sampling order.
+    """
+    # Structure of arrays: each coordinate is one contiguous float32 stream
+    x, y, z = (np.ascontiguousarray(points[:, k], dtype=np.float32) for k in range(3))
+    return _fps_kernel(x, y, z, count, start_index(len(points), seed))
+
+def voxel_candidates(points, target):
+    """
+    Indices of about `target` points: the first point of each occupied voxel, with the voxel
+    size tuned so the number of occupied voxels lands near `target`.
+    """
+    low = points.min(axis=0)
+    extent = float((points.max(axis=0) - low).max()) or 1.0
+    size = extent / np.sqrt(target)  # surfaces fill voxels roughly quadratically
+    for _ in range(6):
+        cells = np.floor((points - low) / size).astype(np.int64)
+        keys = np.ravel_multi_index(cells.T, cells.max(axis=0) + 1)
+        _, first = np.unique(keys, return_index=True)
+        if 0.8 * target <= len(first) <= 1.5 * target:
+            break
+        size *= np.sqrt(len(first) / target)
+    return np.sort(first)
+
+def voxel_fps(points, count, seed=None, oversample=FPS_OVERSAMPLE):
+    """
+    Approximate FPS: exact FPS over voxel representatives instead of every point. Cost no
+    longer grows with the input size once the candidates are picked.
+    """
+    if len(points) <= oversample * count:
+        return exact_fps(points, count, seed)
+    candidates = voxel_candidates(points, int(oversample * count))
+    if len(candidates) < count:
+        return exact_fps(points, count, seed)
+    return candidates[exact_fps(points[candidates], count, seed)]
+
+def farthest_point_sample(points, count, mode=None, seed=FPS_SEED):
+    """
+    Indices of `count` points spread over `points` (N, 3), by the configured FPS engine.
+    """
+    mode = mode or FPS_MODE
+    if mode == "exact":
+        return exact_fps(points, count, seed)
+    if mode == "voxel":
+        return voxel_fps(points, count, seed)
+    if mode == "torch":
+        from utils import farthest_point_sample as torch_fps
+
+        return torch_fps(points, count)
+    raise ValueError(f"Unknown FPS mode: {mode}")
+
+def warmup():
+    """
+    Compile the kernel ahead of the first request.
+    """
+    exact_fps(np.zeros((2, 3), dtype=np.float32), 1)
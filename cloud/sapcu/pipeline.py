@@ -0,0 +1,158 @@
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from seeds import SEED_STEP, seed_points
+from spatial import SpatialIndex
+from fps import farthest_point_sample
+from utils import rotate_patches
+
+# Requests upsampled at once (main.py's executor size)
+MAX_CONCURRENCY = int(os.getenv("SAPCU_MAX_CONCURRENCY", 2))
+# Prepared chunks allowed in flight ahead of the models, per request (bounds the extra patch memory)
+PREFETCH = int(os.getenv("SAPCU_PREFETCH", 2))
+# Patch gathering for upcoming chunks runs on this pool while the models process the current
+# one. One slot per in-flight chunk of every concurrent request, so requests never queue
+# behind each other's gathers
+_prepare_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY * PREFETCH, thread_name_prefix="sapcu-prepare")
+# Threads per neighbour query on that pool: the slots share the cores instead of each using all
+PREPARE_QUERY_WORKERS = max((os.cpu_count() or 1) // (MAX_CONCURRENCY * PREFETCH), 1)
+
+def _record(timings, stage, start):
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def _prepare_chunk(tree, data, seeds_chunk):
+    """
+    Patches for one chunk of seeds: the 100 nearest input points of each seed, centered on it.
+    """
+    start = time.perf_counter()
+    _, idx = tree.query(seeds_chunk, 100, workers=PREPARE_QUERY_WORKERS)
+    patches = data[idx] - seeds_chunk[:, None, :]
+    return patches, time.perf_counter() - start
+
+def _prefetch(prepare, chunks, depth=PREFETCH):
+    """
+    Yield futures of prepare(chunk) in chunk order, keeping at most `depth` chunks submitted
+    ahead of the consumer.
+    """
+    chunks = iter(chunks)
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(_prepare_pool.submit(prepare, chunk))
+        if len(pending) >= depth:
+            break
+    while pending:
+        future = pending.popleft()
+        chunk = next(chunks, None)
+        if chunk is not None:
+            pending.append(_prepare_pool.submit(prepare, chunk))
+        yield future
+
+def upsample(xyz_data, model_fn, model_fd, device, num_points=8192, seed_step=SEED_STEP, timings=None):
+    """
+    Upsample one point cloud with SAPCU and resample it to `num_points` points.
+
+    Reentrant: all intermediate state lives in local arrays (no scratch files, no globals),
+    so several requests can run it concurrently on one pair of models in eval mode.
+
+    Args:
+        xyz_data (np.ndarray): (N, >=3) input cloud; only xyz is used.
+        model_fn, model_fd: Normal and displacement models from fn_config / fd_config.
+        device (torch.device): Device the models live on.
+        num_points (int): Size of the farthest point sampled output.
+        seed_step (float): Lattice spacing of the seed points, lattice generator only (see seeds.py).
+        timings (dict): If given, filled with the seconds spent per stage. "neighbors" is
+            prepare-pool time; "model_stall" is how long the models waited for it and
+            "overlap" how much of it was hidden behind model work.
+
+    Returns:
+        np.ndarray: (num_points, 3) upsampled cloud in the input's coordinate frame.
+    """
+    timings = {} if timings is None else timings
+    cloud = np.asarray(xyz_data[:, 0:3], dtype=np.float64)
+
+    # Normalize into the unit box, float32 from here on (the models run in float32)
+    low, high = cloud.min(axis=0), cloud.max(axis=0)
+    loc = (low + high) / 2
+    scale = (high - low).max()
+    data = ((cloud - loc) * (1 / scale)).astype(np.float32)
+
+    # Inference
+    # One index over the input serves seed generation and both model stages
+    tree1 = SpatialIndex(data)
+    
+    # generate seed points
+    print("Generating seed points")
+    start = time.perf_counter()
+    xyz2 = seed_points(data, step=seed_step, tree=tree1).astype(np.float32)
+    _record(timings, "seeds", start)
+    pp = max(xyz2.shape[0] // 400, 1)
+    p_split = np.array_split(xyz2, pp, axis=0)
+    
+    # fn and fd run back to back on each chunk of seeds: one 100-NN query and one set of
+    # patches per chunk serve both stages. Patches for the next chunks are gathered on the
+    # prepare pool meanwhile, at most PREFETCH chunks ahead. Each seed yields exactly one
+    # output point, written in place into a buffer sized up front
+    print("fn + fd")
+    xyzout = np.empty_like(xyz2)
+    offset = 0
+    loop_start = time.perf_counter()
+    prepared = _prefetch(lambda chunk: _prepare_chunk(tree1, data, chunk), p_split)
+    for seeds_chunk, future in zip(p_split, prepared):
+        start = time.perf_counter()
+        patches, prepare_time = future.result()
+        _record(timings, "model_stall", start)
+        timings["neighbors"] = timings.get("neighbors", 0.0) + prepare_time
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            c = model_fn.encode_inputs(torch.from_numpy(patches[None]).float().to(device))
+            normals = model_fn.decode(c).detach().cpu().numpy()
+        _record(timings, "fn", start)
+
+        start = time.perf_counter()
+        patches = rotate_patches(patches, normals, [1, 0, 0])
+        _record(timings, "rotate", start)
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            c = model_fd.encode_inputs(torch.from_numpy(patches[None]).float().to(device))
+            length = model_fd.decode(c).detach().cpu().numpy().reshape(-1, 1)
+        _record(timings, "fd", start)
+        
+        out = xyzout[offset:offset + len(seeds_chunk)]
+        np.multiply(normals, length, out=out, casting="same_kind")
+        out += seeds_chunk
+        offset += len(seeds_chunk)
+        
+    timings["patch_loop"] = time.perf_counter() - loop_start
+    timings["overlap"] = max(timings.get("neighbors", 0.0) - timings.get("model_stall", 0.0), 0.0)
+    print(
+        f"[INFO] patches: prepare {timings.get('neighbors', 0.0):.2f}s, "
+        f"model stall {timings.get('model_stall', 0.0):.2f}s, overlap {timings['overlap']:.2f}s"
+    )
+    
+    # remove outliers
+    print("Remove outliers")
+    start = time.perf_counter()
+    tree3 = SpatialIndex(xyzout)
+    dist, _ = tree3.query(xyzout, 30)
+    avg = dist.mean(axis=1)
+    pointcloud = xyzout[avg < dist.mean() * 1.5]
+    _record(timings, "outliers", start)
+    
+    # Back to the input frame, in place on the filtered copy
+    pointcloud *= scale
+    pointcloud += loc
+    
+    # farthest point sample
+    start = time.perf_counter()
+    centroids = farthest_point_sample(pointcloud, num_points)
+    _record(timings, "fps", start)
+
+    final_output = pointcloud[centroids]
+    return final_output
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+from spatial import SpatialIndex
+
+# Threshold of the `./dense 0.004 N` call, read as a squared distance, and a lattice spacing.
+# Both are assumptions about the binary, whose source is not in this tree; the lattice
+# generator is not yet checked against it (python benchmark.py seeds --dense ./dense)
+SEED_THRESHOLD = 0.004
+SEED_STEP = 1 / 64
+# "dense": the legacy binary (kept until that check is done); "lattice": generate_seeds below
+SEED_GENERATOR = os.getenv("SAPCU_SEED_GENERATOR", "dense")
+DENSE_BINARY = os.getenv("SAPCU_DENSE_BINARY", "./dense")
+
+def run_dense(points, threshold=SEED_THRESHOLD, binary=DENSE_BINARY):
+    """
+    Seed points from the legacy `dense` binary. It reads test.xyz and writes target.xyz in
+    its working directory, so each call gets a scratch directory of its own.
+    """
+    binary = os.path.abspath(binary)
+    with tempfile.TemporaryDirectory() as workdir:
+        np.savetxt(os.path.join(workdir, "test.xyz"), points)
+        subprocess.run([binary, str(threshold), str(len(points))], cwd=workdir, check=True, capture_output=True)
+        return np.loadtxt(os.path.join(workdir, "target.xyz"))[:, :3]
+
+def generate_seeds(points, threshold=SEED_THRESHOLD, step=SEED_STEP, tree=None):
+    """
+    Seed points for upsampling: the nodes of a regular lattice whose squared distance to the
+    nearest input point is below `threshold`, i.e. a thin band of uniformly spaced points
+    around the normalized surface.
+
+    Only lattice nodes within reach of some input point are ever generated, so the cost
+    scales with the surface, not with the bounding volume.
+
+    Args:
+        points (np.ndarray): (N, 3) normalized input cloud.
+        threshold (float): Squared distance to the nearest input point a seed must stay under.
+        step (float): Lattice spacing; the lattice is anchored at the origin.
+        tree (SpatialIndex): Index over `points`, built here if not given.
+
+    Returns:
+        np.ndarray: (M, 3) seed points, ordered by lattice index.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    radius = np.sqrt(threshold)
+    reach = int(np.ceil(radius / step))
+
+    # Lattice offsets that can lie within `radius` of a point in the same cell
+    r = np.arange(-reach, reach + 1)
+    offsets = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+    offsets = offsets[np.linalg.norm(offsets, axis=1) * step <= radius + step * np.sqrt(3)]
+
+    base = np.round(points / step).astype(np.int64)
+    # Deduplicate nodes as packed int64 keys; far cheaper than np.unique(axis=0) on rows
+    low = base.min(axis=0) - reach
+    extent = base.max(axis=0) + reach - low + 1
+    cells = np.ravel_multi_index((base - low).T, extent)
+    strides = np.ravel_multi_index((offsets + reach).T, extent) - np.ravel_multi_index((reach, reach, reach), extent)
+    keys = np.unique((cells[:, None] + strides[None, :]).ravel())
+    candidates = (np.stack(np.unravel_index(keys, extent), axis=1) + low) * step
+
+    tree = tree if tree is not None else SpatialIndex(points)
+    dist, _ = tree.query(candidates, 1)
+    return candidates[dist[:, 0] ** 2 < threshold]
+
+def seed_points(points, step=SEED_STEP, tree=None, generator=None):
+    """
+    Seed points by the configured generator (SAPCU_SEED_GENERATOR). `step` and `tree` only
+    apply to the lattice generator.
+    """
+    generator = generator or SEED_GENERATOR
+    if generator == "dense":
+        return run_dense(points)
+    if generator == "lattice":
+        return generate_seeds(points, step=step, tree=tree)
+    raise ValueError(f"Unknown seed generator: {generator}")
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Threads per query; -1 uses every core
+INDEX_WORKERS = int(os.getenv("SAPCU_INDEX_WORKERS", -1))
+
+class SpatialIndex:
+    """
+    KD-tree over one point set, built once and shared by every stage that searches that set.
+
+    Queries are split across `workers` threads and return float32 distances, which is all
+    the downstream patch building and outlier filtering need.
+    """
+    def __init__(self, points, workers=INDEX_WORKERS, leafsize=16):
+        self.points = points
+        self.workers = workers
+        # Unbalanced, non-compact trees build several times faster and query about as fast
+        self.tree = cKDTree(points, leafsize=leafsize, balanced_tree=False, compact_nodes=False)
+
+    def query(self, queries, k, workers=None):
+        """
+        `workers` overrides the index's thread count for this query.
+
+        Returns:
+            tuple: ((M, k) float32 distances, (M, k) int64 indices), nearest first; always 2-D,
+                also for k=1.
+        """
+        dist, idx = self.tree.query(queries, k=[k] if k == 1 else k, workers=self.workers if workers is None else workers)
+        return dist.astype(np.float32), idx.astype(np.int64, copy=False)
+
+    def __len__(self):
+        return len(self.points)
@@ -18,16 +18,59 @@ def rotation_matrix_from_vectors(vec1, vec2):
     else:
         return np.eye(3) #cross of all zeros only occurs on identical directions
     
+def rotation_matrices_from_vectors(vecs, target, eps=1e-15):
+    """ Batched rotation matrices that align each row of vecs to target (Rodrigues' formula)
+    :param vecs: (P, 3) "source" vectors, need not be normalized
+    :param target: A 3d "destination" vector
+    :param eps: Tolerance on 1 + cos(angle) below which a pair counts as antiparallel
+    :return mats: (P, 3, 3) matrices in the dtype of vecs; mats[i] @ vecs[i] is parallel to target.
+    Parallel pairs get the identity, antiparallel pairs a half turn about an axis orthogonal to target.
+    Built in float64: near antiparallel pairs lose alignment and orthogonality in float32.
+    """
+    a = np.asarray(vecs, dtype=np.float64)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = np.asarray(target, dtype=np.float64).reshape(3)
+    b = b / np.linalg.norm(b)
+    v = np.cross(a, b)
+    # 1 + c as |a + b|^2 / 2, without the cancellation of 1 + a.b near antiparallel
+    one_plus_c = 0.5 * np.sum((a + b) ** 2, axis=1)
+
+    kmat = np.zeros((len(a), 3, 3))
+    kmat[:, 0, 1], kmat[:, 0, 2] = -v[:, 2], v[:, 1]
+    kmat[:, 1, 0], kmat[:, 1, 2] = v[:, 2], -v[:, 0]
+    kmat[:, 2, 0], kmat[:, 2, 1] = -v[:, 1], v[:, 0]
+    # (1 - c) / s^2 == 1 / (1 + c); the latter stays finite as the vectors become parallel
+    antiparallel = one_plus_c < eps
+    factor = 1 / np.where(antiparallel, 1, one_plus_c)
+    mats = np.eye(3) + kmat + (kmat @ kmat) * factor[:, None, None]
+
+    if antiparallel.any():
+        # Half turn about any unit axis u orthogonal to target: 2 u u^T - I
+        helper = np.eye(3)[np.argmin(np.abs(b))]
+        u = np.cross(b, helper)
+        u /= np.linalg.norm(u)
+        mats[antiparallel] = 2 * np.outer(u, u) - np.eye(3)
+    return mats.astype(np.result_type(vecs, np.float32), copy=False)
+
+def rotate_patches(patches, normals, target=(1, 0, 0)):
+    """ Rotate each patch so that its normal points along target
+    :param patches: (P, K, 3) points, centered on their seed
+    :param normals: (P, 3) one normal per patch
+    :return: (P, K, 3) rotated patches
+    """
+    mats = rotation_matrices_from_vectors(normals, target)
+    # (R @ p.T).T == p @ R.T for every point p of every patch, in one batched matmul
+    return np.matmul(patches, mats.transpose(0, 2, 1))
+
 def farthest_point_sample(xyz, pointnumber):
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     N, C = xyz.shape
-    torch.seed()
     xyz=torch.from_numpy(xyz).float().to(device)
     centroids = torch.zeros(pointnumber, dtype=torch.long).to(device)
 
     distance = torch.ones(N).to(device) * 1e32
-    farthest = torch.randint(0, N, (1,), dtype=torch.long).to(device)
-    farthest[0]=N/2
+    # Deterministic start; no global RNG state is touched, so concurrent calls do not interfere
+    farthest = torch.tensor([N // 2], dtype=torch.long, device=device)
     for i in range(pointnumber):
         centroids[i] = farthest
         centroid = xyz[farthest, :]
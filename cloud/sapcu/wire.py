@@ -0,0 +1,22 @@
+import io
+
+import numpy as np
+
+NPY_CONTENT_TYPE = "application/x-npy"
+
+def encode_array(array):
+    """
+    Serialize an array as a little-endian float32 .npy payload (shape and dtype in the header).
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype="<f4"), allow_pickle=False)
+    return buffer.getvalue()
+
+def decode_array(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+def is_npy(content_type):
+    return (content_type or "").split(";")[0].strip() == NPY_CONTENT_TYPE
+
+def accepts_npy(accept):
+    return NPY_CONTENT_TYPE in (accept or "")